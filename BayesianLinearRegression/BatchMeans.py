@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to estimate the Monte Carlo variance of an importance sampling (IS)
+mean estimate from a single run of MP-(Q)MCMC, using batch means over the
+per-iteration weighted sums. The batch means can be computed from the
+stored sequence of weighted sums or accumulated online for dyadic batch
+sizes, with memory independent of the run length.
+"""
+
+import numpy as np
+
+
+def BatchMeansVariance(WeightedSums, BatchSize=None):
+
+    """
+    Estimates the variance of the mean of a sequence of weighted sums by
+    non-overlapping batch means
+
+    Inputs:
+    ------
+    WeightedSums    - array_like
+                    (Number of iterations) x d-dimensional array of
+                    per-iteration weighted sums
+    BatchSize       - int
+                    number of iterations per batch; if None, the batch
+                    size is chosen as floor(sqrt(Number of iterations))
+
+    Outputs:
+    -------
+    Variance        - array_like
+                    d-dimensional array of variance estimates for the
+                    mean of WeightedSums
+    """
+
+    n = WeightedSums.shape[0]
+    if BatchSize is None:
+        BatchSize = int(np.sqrt(n))
+    NumOfBatches = int(n/BatchSize)
+    if NumOfBatches < 2:
+        raise ValueError('BatchSize too large; at least two batches are needed')
+
+    # Discard leading iterations that do not fill a complete batch
+    Batches = WeightedSums[n-NumOfBatches*BatchSize:].reshape(NumOfBatches, \
+                                                BatchSize, -1)
+    BatchMeans = np.mean(Batches, axis=1)
+
+    # Variance of a batch mean, rescaled to the mean over all batches
+    Variance = np.var(BatchMeans, axis=0, ddof=1)/NumOfBatches
+
+    return Variance
+
+
+def CudBatchMeansVariance(WeightedSums, MinNumOfBatches=8):
+
+    """
+    Estimates the variance of the mean of a sequence of weighted sums
+    driven by a CUD seed. Batch mean variances V(b) are computed for dyadic
+    batch sizes b; the convergence rate r >= 1 in V(b) ~ b^(-r) is fitted
+    on the larger batch sizes and V is extrapolated from the largest batch
+    size to the full run length. For an IID seed, r is close to one and
+    the estimate agrees with BatchMeansVariance. The estimate is
+    conservative, since the balance of a CUD seed over its full length
+    is only partially visible within batches.
+
+    Inputs:
+    ------
+    WeightedSums    - array_like
+                    (Number of iterations) x d-dimensional array of
+                    per-iteration weighted sums
+    MinNumOfBatches - int
+                    minimal number of batches used for any batch size
+
+    Outputs:
+    -------
+    Variance        - array_like
+                    d-dimensional array of variance estimates for the
+                    mean of WeightedSums
+    Rate            - array_like
+                    d-dimensional array of fitted convergence rates r
+    """
+
+    n = WeightedSums.shape[0]
+    MaxPower = int(np.log2(n/MinNumOfBatches))
+    if MaxPower < 1:
+        raise ValueError('Too few iterations for CUD batch means estimate')
+
+    # Batch mean variances for dyadic batch sizes
+    Powers = np.arange(MaxPower+1)
+    LogBatchVars = np.zeros((len(Powers), WeightedSums.shape[1]))
+    for k in Powers:
+        BatchSize = 2**k
+        NumOfBatches = int(n/BatchSize)
+        Batches = WeightedSums[n-NumOfBatches*BatchSize:].reshape( \
+                                            NumOfBatches, BatchSize, -1)
+        LogBatchVars[k] = np.log(np.var(np.mean(Batches, axis=1), axis=0, \
+                                        ddof=1))
+
+    return CudExtrapolation(n, LogBatchVars)
+
+
+def CudExtrapolation(n, LogBatchVars):
+
+    """
+    Fits the convergence rate r >= 1 of batch mean variances for batch
+    sizes 2^k, k = 0,...,MaxPower, and extrapolates to batch size n
+
+    Inputs:
+    ------
+    n               - int
+                    number of iterations
+    LogBatchVars    - array_like
+                    (MaxPower+1) x d-dimensional array of log batch mean
+                    variances
+
+    Outputs:
+    -------
+    Variance        - array_like
+                    d-dimensional array of variance estimates
+    Rate            - array_like
+                    d-dimensional array of fitted convergence rates r
+    """
+
+    MaxPower = LogBatchVars.shape[0]-1
+    Powers = np.arange(MaxPower+1)
+
+    # Fit log-linear decay on upper half of batch sizes (asymptotic regime)
+    Used = Powers[int(MaxPower/2):]
+    Coeffs = np.polyfit(Used*np.log(2.), LogBatchVars[Used], 1)
+    Rate = np.maximum(-Coeffs[0], 1.)
+
+    # Extrapolate from the largest batch size to batch size n
+    Variance = np.exp(LogBatchVars[-1] - Rate*(np.log(n) - MaxPower*np.log(2.)))
+
+    return Variance, Rate
+
+
+class OnlineBatchMeans:
+
+    def __init__(self, d):
+
+        """
+        Online accumulator of the mean of a sequence of weighted sums and of
+        the batch means for all dyadic batch sizes 2^k; batches are aligned
+        to the start of the sequence and an incomplete last batch is
+        ignored. The batch means of each level are accumulated by Welford's
+        update of their running mean and sum of squared deviations, which
+        does not cancel when the batch means are nearly equal. Memory is
+        O(d log(n)) for n weighted sums
+
+        Inputs:
+        ------
+        d               - int
+                        dimension of weighted sums
+        """
+
+        self.n = 0
+        self.Sum = np.zeros(d)
+        self.PartialSums = np.zeros((0,d))
+        self.BatchMeans = np.zeros((0,d))
+        self.BatchSqDevs = np.zeros((0,d))
+
+
+    def add(self, WeightedSum):
+
+        """
+        Adds the weighted sum of one iteration
+
+        Inputs:
+        ------
+        WeightedSum     - array_like
+                        d-dimensional weighted sum
+        """
+
+        self.n += 1
+        self.Sum += WeightedSum
+
+        # New level once the first batch of size 2^k can be completed
+        if self.n == 2**len(self.PartialSums):
+            d = len(self.Sum)
+            self.PartialSums = np.vstack((self.PartialSums, self.Sum - WeightedSum))
+            self.BatchMeans = np.vstack((self.BatchMeans, np.zeros(d)))
+            self.BatchSqDevs = np.vstack((self.BatchSqDevs, np.zeros(d)))
+        self.PartialSums += WeightedSum
+
+        # Levels k whose batches are complete, i.e. 2^k divides n
+        for k in range(len(self.PartialSums)):
+            if self.n % 2**k != 0:
+                break
+            BatchMean = self.PartialSums[k]/2**k
+            Delta = BatchMean - self.BatchMeans[k]
+            self.BatchMeans[k] += Delta/int(self.n/2**k)
+            self.BatchSqDevs[k] += Delta*(BatchMean - self.BatchMeans[k])
+            self.PartialSums[k] = 0.
+
+
+    def getNumOfSums(self):
+        return self.n
+
+
+    def getMean(self):
+        return self.Sum/self.n
+
+
+    def getBatchVariance(self, k):
+
+        """
+        Sample variance (ddof=1) of the batch means of batch size 2^k
+        """
+
+        NumOfBatches = int(self.n/2**k)
+
+        return np.maximum(self.BatchSqDevs[k], 0.)/(NumOfBatches-1)
+
+
+    def getVariance(self, Method='batch', BatchSize=None, MinNumOfBatches=8):
+
+        """
+        Estimates the variance of the mean of the weighted sums added so far,
+        as BatchMeansVariance (Method='batch') or CudBatchMeansVariance
+        (Method='cud'); batch sizes are rounded to powers of two
+
+        Inputs:
+        ------
+        Method          - string
+                        either 'batch' or 'cud'
+        BatchSize       - int
+                        number of iterations per batch for Method='batch';
+                        if None, floor(sqrt(Number of iterations)) is used
+        MinNumOfBatches - int
+                        minimal number of batches for Method='cud'
+
+        Outputs:
+        -------
+        Variance        - array_like
+                        d-dimensional array of variance estimates
+        """
+
+        if Method == 'batch':
+            if BatchSize is None:
+                BatchSize = int(np.sqrt(self.n))
+            k = int(np.round(np.log2(BatchSize)))
+            if self.n < 2**(k+1):
+                raise ValueError('BatchSize too large; at least two batches are needed')
+            return self.getBatchVariance(k)/int(self.n/2**k)
+
+        elif Method == 'cud':
+            MaxPower = int(np.log2(self.n/MinNumOfBatches))
+            if MaxPower < 1:
+                raise ValueError('Too few iterations for CUD batch means estimate')
+            LogBatchVars = np.log([self.getBatchVariance(k) for k in range(MaxPower+1)])
+            return CudExtrapolation(self.n, LogBatchVars)[0]
+
+        else:
+            raise ValueError('Method must be chosen either as "batch" or as "cud"')
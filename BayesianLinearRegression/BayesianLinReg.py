@@ -15,13 +15,21 @@ import matplotlib.pyplot as plt
 from scipy.stats import norm
 from Data import DataGen
 from Seed import SeedGen
+from Storage import SampleBuffer, CountSampleBuffer, ProposalArchive, \
+                    ArchiveEstimate, FunctionalSums
+from Marginals import WeightedHistogram, WeightedDigest, PlotMarginalDensity
+from Workspace import IterationWorkspace
+from BatchMeans import BatchMeansVariance, CudBatchMeansVariance, OnlineBatchMeans
 #from Seed_digShift import SeedGen
 
 
 class BayesianLinReg:
     
     def __init__(self, d, alpha, x0, N, StepSize, PowerOfTwo, \
-                 InitMean, InitCov, Stream, WeightIn=0):
+                 InitMean, InitCov, Stream, WeightIn=0, History=True, BurnIn=0, \
+                 SampleFile=None, \
+                 CountSamples=False, ArchiveDir=None, Funs=None, \
+                 NumOfBins=None):
     
         """
         Implements the Bayesian Linear Regression based on Data set "Data.txt" 
@@ -51,7 +59,46 @@ class BayesianLinReg:
                         either 'cud' or 'iid'; defining what seed is used
         WeightIn        - float
                         if BurnIn-run existed, weight initial esitmates
-                        by int(WeightIn/N)-times                
+                        by int(WeightIn/N)-times in the proposal mean and
+                        covariance; they do not enter the IS-estimates                
+        History         - bool
+                        store samples, acceptance values and per-iteration
+                        weighted sums and covariances; if False, only
+                        running accumulators of the IS-estimates, their
+                        batch means and the acceptance rate are kept, with
+                        memory independent of the run length
+        BurnIn          - int
+                        Burn-In period excluded from the accumulators if
+                        History=False, counted in samples of the sampling
+                        iterations only and applied to all IS-estimates,
+                        ESS and marginals alike, regardless of WeightIn
+                        (with History=True, Burn-In is chosen
+                        when calling the get-methods; the marginal
+                        accumulators always exclude it)
+        SampleFile      - string
+                        if given (and History=True), samples and acceptance
+                        values are streamed into .npy memmaps at this path
+                        instead of being kept in memory
+        CountSamples    - bool
+                        if True (and History=True), the distinct states
+                        drawn per iteration are stored once with per-sample
+                        indices; samples are expanded lazily by
+                        getSamples, weighted statistics use getSampleCounts
+        ArchiveDir      - string
+                        if given, all proposals and their log IS-weights
+                        are archived as float32 files in this (new or
+                        empty) directory, see getIS_ArchiveEstimate
+        Funs            - list
+                        vectorised functions mapping the (N+1) x d-
+                        dimensional array of proposals to (N+1) or
+                        (N+1) x k values; their IS-estimates are
+                        accumulated in the same pass, see
+                        getIS_FunMeanEstimate
+        NumOfBins       - int
+                        if given, IS-weighted marginal histograms with
+                        NumOfBins bins and quantile digests of all
+                        coordinates are accumulated from the proposals,
+                        see getMarginalDensity and getMarginalQuantiles
         """
     
         #################
@@ -84,32 +131,62 @@ class BayesianLinReg:
         # Initialisation #
         ##################
     
-        # List of samples to be collected
-        self.xVals = list()
-        self.xVals.append(x0)
-    
         # Iteration number
         NumOfIter = int(int((2**PowerOfTwo-1)/(d+1))*(d+1)/(N))
         print ('Total number of Iterations = ', NumOfIter)
     
-        # set up acceptance rate array
-        self.AcceptVals = list()
-    
         # initialise
-        xI = self.xVals[0]
+        xI = x0
         I = 0
         
         
         # Number of iterations used for initial approximated posterior mean
         M = int(WeightIn/N)+1        
         
-        
-        # Weighted Sum and Covariance Arrays
-        self.WeightedSum = np.zeros((NumOfIter+M,d))
-        self.WeightedCov = np.zeros((NumOfIter+M,d,d)) 
-        self.WeightedFunSum = np.zeros((NumOfIter+M,d))
-        self.WeightedSum[0:M,:] = InitMean
-        self.WeightedCov[0:M,:] = InitCov 
+        # Archive of proposals and log IS-weights
+        self.ArchiveDir = ArchiveDir
+        if ArchiveDir is not None:
+            Archive = ProposalArchive(ArchiveDir, N)
+
+        # Weighted sums of functionals of proposals
+        self.FunSums = None
+        if Funs is not None:
+            self.FunSums = FunctionalSums(Funs, NumOfIter, History)
+
+        # Streaming IS-weighted marginal histograms and quantiles
+        self.Histogram = None
+        self.NumOfBins = NumOfBins
+        self.BurnIn = BurnIn
+        if NumOfBins is not None:
+            self.Histogram = WeightedHistogram(d, NumOfBins)
+            self.Digest = WeightedDigest(d)
+
+        self.History = History
+        if History:
+            # Preallocated buffer of samples and acceptance values
+            if CountSamples:
+                self.Buffer = CountSampleBuffer(NumOfIter, N, d, N+1)
+            else:
+                self.Buffer = SampleBuffer(NumOfIter*N, d, SampleFile)
+        
+            # Weighted Sum and Covariance Arrays
+            self.WeightedSum = np.zeros((NumOfIter,d))
+            self.WeightedCov = np.zeros((NumOfIter,d,d)) 
+            self.WeightESS = np.zeros(NumOfIter)
+        else:
+            # Running IS-estimates and acceptance rate after Burn-In
+            Start           = int(BurnIn/N)
+            self.Estimates  = OnlineBatchMeans(d)
+            self.CovSum     = np.zeros((d,d))
+            self.AcceptSum  = 0.
+            self.NumOfAccepts = 0
+            self.WeightESSSum = 0.
+            self.NumOfWeightESS = 0
+
+        # Running sums of weighted sums and covariances for proposal,
+        # counting initial estimates as first M iterations
+        self.SumWeightedSum = M*InitMean
+        self.SumWeightedCov = M*InitCov
         
 
         # Approximate Posterior Mean and Covariance as initial estimates
@@ -120,6 +197,14 @@ class BayesianLinReg:
         # Cholesky decomposition of initial Approximate Posterior Covariance
         CholApprPostCov = np.linalg.cholesky(self.ApprPostCov)
         InvApprPostCov = np.linalg.inv(self.ApprPostCov)
+
+        # Preallocated arrays of iterations
+        Workspace = IterationWorkspace(N, d)
+
+        # Log-posterior of the current state, carried over between
+        # iterations so that only the N new proposals are evaluated
+        LogPosterior_xI = -0.5*np.dot(xI, np.dot(InvG_prior, xI)) \
+                            - 0.5*alpha*np.sum((np.dot(X, xI) - Obs)**2)
         
         
         ####################
@@ -140,31 +225,46 @@ class BayesianLinReg:
                                                     scale=StepSize), CholApprPostCov)
             
             # Add current state xI to proposals    
-            Proposals = np.insert(y, 0, xI, axis=0)
+            Proposals = Workspace.setProposals(y, xI)
     
     
             ########################################################
             # Compute probability ratios = weights of IS-estimator #
             ########################################################
     
-            # Compute Log-posterior probabilities
-            LogPriors = -0.5*np.dot(np.dot(Proposals, InvG_prior), Proposals.T).diagonal(0) # Zellner's g-prior
-            fs = np.dot(X,Proposals.T)
-            LogLikelihoods  = -0.5*alpha*np.dot(Obs-fs.T, (Obs-fs.T).T).diagonal(0)
-            LogPosteriors   = LogPriors + LogLikelihoods
+            # Compute Log-posterior probabilities of new proposals, that of
+            # the current state is carried over from the previous iteration
+            LogPriors = Workspace.quadraticForms(Proposals[1:], InvG_prior, 'LogPriors') # Zellner's g-prior
+            LogPriors *= -0.5
+            fs = np.dot(X, Proposals[1:].T, out=Workspace.array('fs', (NumOfSamples,N)))
+            fs -= Obs[:,None]
+            LogLikelihoods  = np.einsum('ij,ij->j', fs, fs, out=Workspace.array('LogLikelihoods', N))
+            LogLikelihoods *= -0.5*alpha
+            LogPosteriors   = Workspace.array('LogPosteriors', N+1)
+            LogPosteriors[0] = LogPosterior_xI
+            np.add(LogPriors, LogLikelihoods, out=LogPosteriors[1:])
     
             # Compute Log of transition probabilities
-            LogK_ni = -0.5*np.dot(np.dot(Proposals-self.ApprPostMean, InvApprPostCov/(StepSize**2)), \
-                                 (Proposals - self.ApprPostMean).T).diagonal(0)
+            LogK_ni = Workspace.quadraticForms(Workspace.residuals(self.ApprPostMean), \
+                                               InvApprPostCov, 'LogK_ni')
+            LogK_ni *= -0.5/StepSize**2
             LogKs = np.sum(LogK_ni) - LogK_ni # from any state to all others
             
 
-            # Compute weights
-            LogPstates = LogPosteriors + LogKs
-            Sorted_LogPstates = np.sort(LogPstates)
-            LogPstates = LogPstates - (Sorted_LogPstates[0] + \
-                    np.log(1 + np.sum(np.exp(Sorted_LogPstates[1:] - Sorted_LogPstates[0]))))
-            Pstates = np.exp(LogPstates)
+            # Normalise weights and sample N new states
+            LogPstates, Pstates, Is, ESS = Workspace.normaliseAndResample( \
+                                                LogPosteriors, LogKs, U[:,d])
+
+            # Store or accumulate ESS of IS-weights
+            if History:
+                self.WeightESS[n] = ESS
+            elif n >= Start:
+                self.WeightESSSum += ESS
+                self.NumOfWeightESS += 1
+
+            # Archive proposals and normalised log IS-weights
+            if ArchiveDir is not None:
+                Archive.append(Proposals, LogPstates)
     
     
             #######################
@@ -172,42 +272,65 @@ class BayesianLinReg:
             #######################
     
             # Compute weighted sum as posterior mean estimate
-            WeightedStates = np.tile(Pstates, (d,1)) * Proposals.T
-            self.WeightedSum[n+M,:] = np.sum(WeightedStates, axis=1).copy()
+            WeightedSum = Workspace.weightedSum(Pstates)
 
             # Update Approximate Posterior Mean
-            self.ApprPostMean = np.mean(self.WeightedSum[:n+M+1,:], axis=0) 
+            self.SumWeightedSum = self.SumWeightedSum + WeightedSum
+            self.ApprPostMean = self.SumWeightedSum/(n+M+1)
 
             # Compute weighted sum as posterior covariance estimate
-            B1 = (Proposals - self.ApprPostMean).reshape(N+1,d,1) 
-            B2 = np.transpose(B1,(0,2,1)) 
-            A = np.matmul(B1, B2)
-            self.WeightedCov[n+M,:,:] = np.sum((np.tile(Pstates, (d,d,1)) * A.T).T, axis=0)
+            WeightedCov = Workspace.weightedCov(Pstates, self.ApprPostMean)
+            self.SumWeightedCov = self.SumWeightedCov + WeightedCov
 
             InvApprPostCov = np.linalg.inv(self.ApprPostCov)
 
             if n> 2*d/N: # makes sure NumOfSamples > d for covariance estimate
-                self.ApprPostCov = np.mean(self.WeightedCov[:n+M+1,:,:], axis=0)
+                self.ApprPostCov = self.SumWeightedCov/(n+M+1)
                 CholApprPostCov = np.linalg.cholesky(self.ApprPostCov)
                 InvApprPostCov = np.linalg.inv(self.ApprPostCov)
+
+            # Store or accumulate IS-estimates
+            if History:
+                self.WeightedSum[n,:] = WeightedSum
+                self.WeightedCov[n,:,:] = WeightedCov
+            elif n >= Start:
+                self.Estimates.add(WeightedSum)
+                self.CovSum += WeightedCov
+
+            # Accumulate weighted sums of functionals after Burn-In
+            if Funs is not None and (History or n >= Start):
+                self.FunSums.add(Proposals, Pstates)
+
+            # Accumulate marginal histograms and quantiles after Burn-In
+            if NumOfBins is not None and n >= int(BurnIn/N):
+                self.Histogram.add(Proposals, Pstates)
+                self.Digest.add(Proposals, Pstates)
     
             ##################################
             # Sample according to IS-weights #
             ##################################
     
-            # Sample N new states 
-            PstatesSum = np.cumsum(Pstates)
-            Is = np.searchsorted(PstatesSum, U[:,d:].flatten())
-            xvals_new = Proposals[Is]
-            self.xVals.append(xvals_new)
-    
             # Compute approximate acceptance rate
             AcceptValsNew = 1. - Pstates[Is]
-            self.AcceptVals.append(AcceptValsNew)
+
+            # Add new samples and acceptance values to buffer
+            if History:
+                self.Buffer.append(Proposals, Is, AcceptValsNew)
+            else:
+                Kept = AcceptValsNew[max(BurnIn-n*N, 0):]
+                self.AcceptSum += np.sum(Kept)
+                self.NumOfAccepts += len(Kept)
     
             # Update current state
             I = Is[-1]
             xI = Proposals[I,:]
+            LogPosterior_xI = LogPosteriors[I]
+
+        # Write memmapped samples and remaining archive to disk
+        if History:
+            self.Buffer.flush()
+        if ArchiveDir is not None:
+            Archive.flush()
     
     
     def getSamples(self, BurnIn=0):
@@ -226,9 +349,38 @@ class BayesianLinReg:
                 (Number of samples) x d-dimensional arrayof Samples      
         """
         
-        Samples = np.concatenate(self.xVals[1:], axis=0)[BurnIn:,:]
+        if not self.History:
+            raise ValueError('Samples are only stored if History=True')
+        
+        Samples = self.Buffer.getSamples(BurnIn)
                 
         return Samples
+
+
+    def getSampleCounts(self, BurnIn=0):
+        
+        """
+        Distinct stored states and their numbers of occurrences among the
+        samples after Burn-In, e.g. for weighted statistics without
+        expanding samples
+        
+        Inputs:
+        ------
+        BurnIn  - int 
+                Burn-In period
+        
+        Outputs:
+        -------
+        States  - array_like
+                (Number of states) x d-dimensional array of states
+        Counts  - array_like
+                (Number of states)-dimensional array of counts
+        """
+        
+        if not self.History:
+            raise ValueError('Samples are only stored if History=True')
+        
+        return self.Buffer.getCounts(BurnIn)
        
         
     def getAcceptRate(self, BurnIn=0):
@@ -247,12 +399,43 @@ class BayesianLinReg:
                     average acceptance rate of MP-QMCMC 
         """    
         
-        AcceptVals = np.concatenate(self.AcceptVals)[BurnIn:]
-        AcceptRate = np.mean(AcceptVals)
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.AcceptSum/self.NumOfAccepts
+        
+        AcceptRate = self.Buffer.getAcceptRate(BurnIn)
         
         return AcceptRate
 
      
+    def getIS_WeightESS(self, N, BurnIn=0):
+        
+        """
+        Compute average effective sample size 1/sum(w^2) of the normalised
+        IS-weights w of an iteration, between 1 and the number of states
+        
+        Inputs:
+        ------
+        N           - int
+                    number of proposals per iteration
+        BurnIn      - int
+                    Burn-In period
+        
+        Outputs:
+        -------
+        WeightESS   - float
+                    average ESS of IS-weights per iteration
+        """
+        
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.WeightESSSum/self.NumOfWeightESS
+        
+        WeightESS = np.mean(self.WeightESS[int(BurnIn/N):])
+        
+        return WeightESS
+
+
     def getIS_MeanEstimate(self, N, BurnIn=0):
         
         """
@@ -271,15 +454,91 @@ class BayesianLinReg:
                         d-dimensional array
         """            
         
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.Estimates.getMean()
+        
         WeightedMean = np.mean(self.WeightedSum[int(BurnIn/N):,:], axis=0)
         
         return WeightedMean
     
 
+
+    def getIS_ArchiveEstimate(self, Fun, BurnIn=0):
+        
+        """
+        Compute importance sampling estimate of the posterior expectation of
+        an arbitrary function from the archive of proposals and log
+        IS-weights, without evaluating the posterior
+        
+        Inputs:
+        ------
+        Fun         - callable
+                    vectorised function mapping an (Number of states) x d-
+                    dimensional array to (Number of states) or
+                    (Number of states) x k values
+        BurnIn      - int 
+                    Burn-In period
+        
+        Outputs:
+        -------
+        Estimate    - array_like
+                    IS-estimate, of the shape of one value of Fun
+        """            
+        
+        if self.ArchiveDir is None:
+            raise ValueError('Proposals are only archived if ArchiveDir is given')
+        
+        return ArchiveEstimate(self.ArchiveDir, Fun, BurnIn)
+
+
+    def getIS_MeanVarEstimate(self, N, BurnIn=0, Method='batch', BatchSize=None):
+        
+        """
+        Estimate the Monte Carlo variance of the importance sampling mean
+        estimate from this single run by batch means over WeightedSum
+        
+        Inputs:
+        ------
+        N           - int
+                    number of proposals per iteration
+        BurnIn      - int 
+                    Burn-In period
+        Method      - string
+                    either 'batch' (batch means with batch size BatchSize)
+                    or 'cud' (dyadic batch means with fitted rate, suited
+                    for CUD driven runs)
+        BatchSize   - int
+                    iterations per batch for Method='batch'; if None,
+                    floor(sqrt(Number of iterations)) is used
+        
+        Outputs:
+        -------
+        Variance    - array_like
+                    d-dimensional array of variance estimates
+        """            
+        
+        # Without History, online dyadic batch means after the Burn-In of
+        # the run are used
+        if not self.History:
+            return self.Estimates.getVariance(Method, BatchSize)
+        
+        WeightedSum = self.WeightedSum[int(BurnIn/N):,:]
+        
+        if Method == 'batch':
+            Variance = BatchMeansVariance(WeightedSum, BatchSize)
+        elif Method == 'cud':
+            Variance = CudBatchMeansVariance(WeightedSum)[0]
+        else:
+            raise ValueError('Method must be chosen either as "batch" or as "cud"')
+        
+        return Variance
+
+
     def getIS_FunMeanEstimate(self, N, BurnIn=0):
         
         """
-        Compute importance sampling estimate
+        Compute importance sampling estimates of the functionals Funs
 
         Inputs:
         -------   
@@ -290,14 +549,19 @@ class BayesianLinReg:
                 
         Outputs:
         -------
-        WeightedMean    - array_like
-                        d-dimensional array
+        WeightedMeans   - list
+                        IS-estimates, each of the shape of one value of
+                        its functional
         """            
         
-        WeightedMean = np.mean(self.WeightedFunSum[int(BurnIn/N):,:], axis=0)
+        if self.FunSums is None:
+            raise ValueError('Functionals are only estimated if Funs is given')
+        
+        # Without History, the Burn-In of the run applies
+        WeightedMeans = self.FunSums.getMean(int(BurnIn/N))
         
-        return WeightedMean    
-  
+        return WeightedMeans
+
 
     def getIS_CovEstimate(self, N, BurnIn=0):
         
@@ -316,32 +580,104 @@ class BayesianLinReg:
         WeightedCov - d-dimensional array
         """            
         
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.CovSum/self.Estimates.getNumOfSums()
+        
         WeightedCov = np.mean(self.WeightedCov[int(BurnIn/N):,:,:], axis=0)
         
         return WeightedCov    
     
       
-    def getMarginalHistogram(self, Index=0, BarNum=100, BurnIn=0):
+    def getMarginalDensity(self):
+        
+        """
+        IS-weighted marginal densities of all coordinates, accumulated
+        during the run after Burn-In
+        
+        Outputs:
+        -------
+        Edges   - array_like
+                d x (NumOfBins+1)-dimensional array of bin edges
+        Density - array_like
+                d x NumOfBins-dimensional array of densities
+        """
+        
+        if self.Histogram is None:
+            raise ValueError('Marginals are only accumulated if NumOfBins is given')
+        
+        return self.Histogram.getDensity()
+
+
+    def getMarginalQuantiles(self, Probs):
         
         """
-        Plot histogram of marginal distribution for posterior samples using 
-        MP-QMCMC
+        IS-weighted marginal quantiles of all coordinates, accumulated
+        during the run after Burn-In
+        
+        Inputs:
+        ------
+        Probs       - array_like
+                    probabilities in [0,1]
+        
+        Outputs:
+        -------
+        Quantiles   - array_like
+                    (Number of probabilities) x d-dimensional array
+        """
+        
+        if self.Histogram is None:
+            raise ValueError('Marginals are only accumulated if NumOfBins is given')
+        
+        return self.Digest.getQuantiles(Probs)
+
+
+    def getMarginalHistogram(self, Index=0, BarNum=None, BurnIn=None):
+        
+        """
+        Plot histogram of the marginal distribution of one coordinate. With
+        History, it is formed from the stored samples of MP-QMCMC; without
+        History, the IS-weighted histogram accumulated during the run is
+        plotted, which is fixed to the NumOfBins and Burn-In of the run,
+        see getMarginalDensity
         
         Inputs:
         ------
         Index   - int
                 index of dimension for marginal distribution
+        BarNum  - int
+                number of bins; if None, 100 with History and NumOfBins
+                of the run otherwise
         BurnIn  - int
-                Burn-In period
+                Burn-In period; if None, 0 with History and Burn-In of the
+                run otherwise
         
         Outputs:
         -------
         Plot
         """         
 
+        # Without History, only the IS-weighted histogram accumulated after
+        # the Burn-In of the run is available
+        if not self.History:
+            if self.Histogram is None:
+                raise ValueError('Without History, marginals are only available if NumOfBins is given')
+            if BarNum not in (None, self.NumOfBins) or BurnIn not in (None, self.BurnIn):
+                raise ValueError('Without History, the marginal histogram is fixed to ' \
+                                 'NumOfBins={} and BurnIn={} of the run'.format( \
+                                 self.NumOfBins, self.BurnIn))
+            Edges, Density = self.Histogram.getDensity()
+            return PlotMarginalDensity(Edges[Index], Density[Index])
+
+        if BarNum is None:
+            BarNum = 100
+        if BurnIn is None:
+            BurnIn = 0
+        States, Counts = self.getSampleCounts(BurnIn)
         Fig = plt.figure()
         SubPlot = Fig.add_subplot(111)
-        SubPlot.hist(self.getSamples(BurnIn)[:,Index], BarNum, label = "PDF Histogram", density = True)
+        SubPlot.hist(States[:,Index], BarNum, weights = Counts, label = "PDF Histogram", \
+                     density = True)
         
         return Fig
 
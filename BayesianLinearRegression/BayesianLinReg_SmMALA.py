@@ -15,12 +15,20 @@ import matplotlib.pyplot as plt
 from scipy.stats import norm
 from Data import DataGen
 from Seed import SeedGen
+from Storage import SampleBuffer, CountSampleBuffer, ProposalArchive, \
+                    ArchiveEstimate, FunctionalSums
+from Marginals import WeightedHistogram, WeightedDigest, PlotMarginalDensity
+from Workspace import IterationWorkspace
+from BatchMeans import BatchMeansVariance, CudBatchMeansVariance, OnlineBatchMeans
 #from Seed_digShift import SeedGen
 
 
 class BayesianLinReg:
     
-    def __init__(self, d, alpha, x0, N, StepSize, CovScaling, PowerOfTwo, Stream='cud'):
+    def __init__(self, d, alpha, x0, N, StepSize, CovScaling, PowerOfTwo, Stream='cud', \
+                 History=True, BurnIn=0, SampleFile=None, \
+                 CountSamples=False, ArchiveDir=None, Funs=None, \
+                 NumOfBins=None):
     
         """
         Implements the Bayesian Linear Regression based on Data set "Data.txt" 
@@ -45,6 +53,41 @@ class BayesianLinReg:
                         defines size S of seed by S=2**PowerOfTwo-1
         Stream          - string
                         either 'cud' or 'iid'; defining what seed is used
+        History         - bool
+                        store samples, acceptance values and per-iteration
+                        weighted sums; if False, only running accumulators
+                        of the IS-estimate, its batch means and the
+                        acceptance rate are kept, with memory independent
+                        of the run length
+        BurnIn          - int
+                        Burn-In period excluded from the accumulators if
+                        History=False (with History=True, Burn-In is chosen
+                        when calling the get-methods; the marginal
+                        accumulators always exclude it)
+        SampleFile      - string
+                        if given (and History=True), samples and acceptance
+                        values are streamed into .npy memmaps at this path
+                        instead of being kept in memory
+        CountSamples    - bool
+                        if True (and History=True), the distinct states
+                        drawn per iteration are stored once with per-sample
+                        indices; samples are expanded lazily by
+                        getSamples, weighted statistics use getSampleCounts
+        ArchiveDir      - string
+                        if given, all proposals and their log IS-weights
+                        are archived as float32 files in this (new or
+                        empty) directory, see getIS_ArchiveEstimate
+        Funs            - list
+                        vectorised functions mapping the (N+1) x d-
+                        dimensional array of proposals to (N+1) or
+                        (N+1) x k values; their IS-estimates are
+                        accumulated in the same pass, see
+                        getIS_FunMeanEstimate
+        NumOfBins       - int
+                        if given, IS-weighted marginal histograms with
+                        NumOfBins bins and quantile digests of all
+                        coordinates are accumulated from the proposals,
+                        see getMarginalDensity and getMarginalQuantiles
         """
     
         #################
@@ -75,31 +118,74 @@ class BayesianLinReg:
         # Fisher Information as constant metric tensor
         FisherInfo = InvG_prior + alpha*np.dot(X.T,X)
         InvFisherInfo = np.linalg.inv(FisherInfo)  
+
+        # Cholesky factor of proposal covariance and affine Langevin drift
+        # map, computed once per run
+        CholPropCov, DriftScale, DriftShift = SmMALAPrecomputation(X, Obs, alpha, \
+                                                InvFisherInfo, StepSize, CovScaling)
         
          
         ##################
         # Initialisation #
         ##################
     
-        # List of samples to be collected
-        self.xVals = list()
-        self.xVals.append(x0)
-    
         # Iteration number
 #        NumOfIter = int(int((2**PowerOfTwo-1)/d)*d/(N+1))
         NumOfIter = int(int((2**PowerOfTwo-1)/(d+1))*(d+1)/(N+1))
         
         print ('Total number of Iterations = ', NumOfIter)
     
-        # set up acceptance rate array
-        self.AcceptVals = list()
-    
         # initialise
-        xI = self.xVals[0]
+        xI = x0
         I = 0
         
-        # Weighted Sum and Covariance Arrays
-        self.WeightedSum = np.zeros((NumOfIter,d))
+        # Archive of proposals and log IS-weights
+        self.ArchiveDir = ArchiveDir
+        if ArchiveDir is not None:
+            Archive = ProposalArchive(ArchiveDir, N)
+
+        # Weighted sums of functionals of proposals
+        self.FunSums = None
+        if Funs is not None:
+            self.FunSums = FunctionalSums(Funs, NumOfIter, History)
+
+        # Streaming IS-weighted marginal histograms and quantiles
+        self.Histogram = None
+        self.NumOfBins = NumOfBins
+        self.BurnIn = BurnIn
+        if NumOfBins is not None:
+            self.Histogram = WeightedHistogram(d, NumOfBins)
+            self.Digest = WeightedDigest(d)
+
+        self.History = History
+        if History:
+            # Preallocated buffer of samples and acceptance values
+            if CountSamples:
+                self.Buffer = CountSampleBuffer(NumOfIter, N, d, N+1)
+            else:
+                self.Buffer = SampleBuffer(NumOfIter*N, d, SampleFile)
+        
+            # Weighted Sum and Covariance Arrays
+            self.WeightedSum = np.zeros((NumOfIter,d))
+            self.WeightESS = np.zeros(NumOfIter)
+        else:
+            # Running IS-estimate and acceptance rate after Burn-In
+            Start           = int(BurnIn/N)
+            self.Estimates  = OnlineBatchMeans(d)
+            self.AcceptSum  = 0.
+            self.NumOfAccepts = 0
+            self.WeightESSSum = 0.
+            self.NumOfWeightESS = 0
+
+        # Preallocated arrays of iterations with N states (current state
+        # and N-1 proposals)
+        Workspace = IterationWorkspace(N-1, d)
+
+        # Log-posterior and drift mean of the current state, carried over
+        # between iterations so that only the N-1 new proposals are evaluated
+        LogPosterior_xI = -0.5*np.dot(xI, np.dot(InvG_prior, xI)) \
+                            - 0.5*alpha*np.sum((np.dot(X, xI) - Obs)**2)
+        Mean_xI = DriftScale*xI + DriftShift
         
     
         ####################
@@ -116,56 +202,60 @@ class BayesianLinReg:
 #            U = xs[n*(N+1):(n+1)*(N+1),:]
             U = xs[n*(N):(n+1)*(N),:]
     
-            # Compute proposal mean according to Langevin
-            GradLog_xI = -np.dot(InvG_prior,xI) + alpha * np.dot(X.T, (Obs - np.dot(X, xI)))
-            Mean_xI = xI + StepSize**2/2.*np.dot(InvFisherInfo,GradLog_xI)
-                
             # Generate auxiliary proposal state according to MALA 
-            # (facilitates computation of proposing probabilities)
-            z = Mean_xI + np.dot(norm.ppf(U[0,:d], loc=np.zeros(d), scale=1.), \
-                               np.linalg.cholesky(CovScaling**2*InvFisherInfo).T)    
-            
-            # Compute mean of auxiliary proposal state according to MALA
-            GradLog_z = -np.dot(InvG_prior,z) + alpha * np.dot(X.T, (Obs - np.dot(X, z)))
-            Mean_z = z + StepSize**2/2.*np.dot(InvFisherInfo,GradLog_z)
-    
-            # Generate proposals via inverse CDF transformation
-            y = Mean_z + np.dot(norm.ppf(U[1:,:d], loc=np.zeros(d), scale=1.), \
-                              np.linalg.cholesky(CovScaling**2*InvFisherInfo).T)
-   
-            
+            # (facilitates computation of proposing probabilities) and
+            # proposals via inverse CDF transformation, with their drift means
+            z, Mean_z, y, Mean_y = SmMALADrift(norm.ppf(U[:,:d], loc=np.zeros(d), scale=1.), \
+                                        Mean_xI, CholPropCov, DriftScale, DriftShift)
     
             # Add current state xI to proposals    
-            Proposals = np.insert(y, I, xI, axis=0)
+            Proposals = Workspace.setProposals(y, xI, I)
     
     
             ########################################################
             # Compute probability ratios = weights of IS-estimator #
             ########################################################
     
-            # Compute Log-posterior probabilities
-            LogPriors = -0.5*np.dot(np.dot(Proposals, InvG_prior), Proposals.T).diagonal(0) # Zellner's g-prior
-            fs = np.dot(X,Proposals.T)
-            LogLikelihoods  = -0.5*alpha*np.dot(Obs-fs.T, (Obs-fs.T).T).diagonal(0)
-            LogPosteriors   = LogPriors + LogLikelihoods
+            # Compute Log-posterior probabilities of new proposals, that of
+            # the current state is carried over from the previous iteration
+            LogPriors = Workspace.quadraticForms(y, InvG_prior, 'LogPriors') # Zellner's g-prior
+            LogPriors *= -0.5
+            fs = np.dot(X, y.T, out=Workspace.array('fs', (NumOfSamples,N-1)))
+            fs -= Obs[:,None]
+            LogLikelihoods  = np.einsum('ij,ij->j', fs, fs, out=Workspace.array('LogLikelihoods', N-1))
+            LogLikelihoods *= -0.5*alpha
+            LogPosteriors   = Workspace.setStates(Workspace.array('LogPosteriors', N), \
+                                                  LogPriors + LogLikelihoods, LogPosterior_xI, I)
     
+            # Drift means of all states, that of the current state is
+            # carried over
+            Mean_Proposals = Workspace.setStates(Workspace.array('Mean_Proposals', (N,d)), \
+                                                 Mean_y, Mean_xI, I)
+
             # Compute Log of transition probabilities
-            GradLog_states = - np.dot(InvG_prior,Proposals.T) \
-                             + alpha * np.dot(X.T, (Obs - np.dot(X, Proposals.T).T).T)
-            Mean_Proposals = Proposals + StepSize**2/2.*np.dot(InvFisherInfo,GradLog_states).T
-            LogKiz = -0.5*np.dot(np.dot(Mean_Proposals-z, FisherInfo/(CovScaling**2)), \
-                                 (Mean_Proposals - z).T).diagonal(0) # from any state to z
-            LogKzi = -0.5*np.dot(np.dot(Proposals-Mean_z, FisherInfo/(CovScaling**2)), \
-                                 (Proposals - Mean_z).T).diagonal(0) # from z to any state
+            LogKiz = Workspace.quadraticForms(np.subtract(Mean_Proposals, z, out=Workspace.Residuals), \
+                                              FisherInfo, 'LogKiz') # from any state to z
+            LogKiz *= -0.5/CovScaling**2
+            LogKzi = Workspace.quadraticForms(Workspace.residuals(Mean_z), FisherInfo, \
+                                              'LogKzi') # from z to any state
+            LogKzi *= -0.5/CovScaling**2
             LogKs = LogKiz + np.sum(LogKzi) - LogKzi
 
                
-            # Compute weights
-            LogPstates = LogPosteriors + LogKs
-            Sorted_LogPstates = np.sort(LogPstates)
-            LogPstates = LogPstates - (Sorted_LogPstates[0] + \
-                    np.log(1 + np.sum(np.exp(Sorted_LogPstates[1:] - Sorted_LogPstates[0]))))
-            Pstates = np.exp(LogPstates)
+            # Normalise weights and sample N new states
+            LogPstates, Pstates, Is, ESS = Workspace.normaliseAndResample( \
+                                                LogPosteriors, LogKs, U[:,d])
+
+            # Store or accumulate ESS of IS-weights
+            if History:
+                self.WeightESS[n] = ESS
+            elif n >= Start:
+                self.WeightESSSum += ESS
+                self.NumOfWeightESS += 1
+
+            # Archive proposals and normalised log IS-weights
+            if ArchiveDir is not None:
+                Archive.append(Proposals, LogPstates)
     
     
             #######################
@@ -173,29 +263,48 @@ class BayesianLinReg:
             #######################
     
             # Compute weighted sum as posterior mean estimate
-            WeightedStates = np.tile(Pstates, (d,1)) * Proposals.T
-            self.WeightedSum[n,:] = np.sum(WeightedStates, axis=1).copy()
+            WeightedSum = Workspace.weightedSum(Pstates)
+            if History:
+                self.WeightedSum[n,:] = WeightedSum
+            elif n >= Start:
+                self.Estimates.add(WeightedSum)
+
+            # Accumulate weighted sums of functionals after Burn-In
+            if Funs is not None and (History or n >= Start):
+                self.FunSums.add(Proposals, Pstates)
+
+            # Accumulate marginal histograms and quantiles after Burn-In
+            if NumOfBins is not None and n >= int(BurnIn/N):
+                self.Histogram.add(Proposals, Pstates)
+                self.Digest.add(Proposals, Pstates)
     
     
             ##################################
             # Sample according to IS-weights #
             ##################################
     
-            # Sample N new states 
-            # Replace Is sampling with QMC sampling step
-            PstatesSum = np.cumsum(Pstates)
-            Is = np.searchsorted(PstatesSum, U[:,d:].flatten())
-            
-            xvals_new = Proposals[Is]
-            self.xVals.append(xvals_new)
-    
             # Compute approximate acceptance rate
             AcceptValsNew = 1. - Pstates[Is]
-            self.AcceptVals.append(AcceptValsNew)
+
+            # Add new samples and acceptance values to buffer
+            if History:
+                self.Buffer.append(Proposals, Is, AcceptValsNew)
+            else:
+                Kept = AcceptValsNew[max(BurnIn-n*N, 0):]
+                self.AcceptSum += np.sum(Kept)
+                self.NumOfAccepts += len(Kept)
     
             # Update current state
             I = Is[-1] #rv_discrete(values=(range(N+1),Pstates)).rvs(size=1)
             xI = Proposals[I,:]
+            LogPosterior_xI = LogPosteriors[I]
+            Mean_xI = Mean_Proposals[I,:]
+
+        # Write memmapped samples and remaining archive to disk
+        if History:
+            self.Buffer.flush()
+        if ArchiveDir is not None:
+            Archive.flush()
     
     
     def getSamples(self, BurnIn=0):
@@ -214,9 +323,38 @@ class BayesianLinReg:
                 (Number of samples) x d-dimensional arrayof Samples      
         """
         
-        Samples = np.concatenate(self.xVals[1:], axis=0)[BurnIn:,:]
+        if not self.History:
+            raise ValueError('Samples are only stored if History=True')
+        
+        Samples = self.Buffer.getSamples(BurnIn)
                 
         return Samples
+
+
+    def getSampleCounts(self, BurnIn=0):
+        
+        """
+        Distinct stored states and their numbers of occurrences among the
+        samples after Burn-In, e.g. for weighted statistics without
+        expanding samples
+        
+        Inputs:
+        ------
+        BurnIn  - int 
+                Burn-In period
+        
+        Outputs:
+        -------
+        States  - array_like
+                (Number of states) x d-dimensional array of states
+        Counts  - array_like
+                (Number of states)-dimensional array of counts
+        """
+        
+        if not self.History:
+            raise ValueError('Samples are only stored if History=True')
+        
+        return self.Buffer.getCounts(BurnIn)
        
         
     def getAcceptRate(self, BurnIn=0):
@@ -235,12 +373,43 @@ class BayesianLinReg:
                     average acceptance rate of MP-QMCMC 
         """    
         
-        AcceptVals = np.concatenate(self.AcceptVals)[BurnIn:]
-        AcceptRate = np.mean(AcceptVals)
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.AcceptSum/self.NumOfAccepts
+        
+        AcceptRate = self.Buffer.getAcceptRate(BurnIn)
         
         return AcceptRate
 
      
+    def getIS_WeightESS(self, N, BurnIn=0):
+        
+        """
+        Compute average effective sample size 1/sum(w^2) of the normalised
+        IS-weights w of an iteration, between 1 and the number of states
+        
+        Inputs:
+        ------
+        N           - int
+                    number of proposals per iteration
+        BurnIn      - int
+                    Burn-In period
+        
+        Outputs:
+        -------
+        WeightESS   - float
+                    average ESS of IS-weights per iteration
+        """
+        
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.WeightESSSum/self.NumOfWeightESS
+        
+        WeightESS = np.mean(self.WeightESS[int(BurnIn/N):])
+        
+        return WeightESS
+
+
     def getIS_MeanEstimate(self, N, BurnIn=0):
         
         """
@@ -259,11 +428,115 @@ class BayesianLinReg:
                         d-dimensional array
         """            
         
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.Estimates.getMean()
+        
         WeightedMean = np.mean(self.WeightedSum[int(BurnIn/N):,:], axis=0)
         
         return WeightedMean
   
 
+
+    def getIS_ArchiveEstimate(self, Fun, BurnIn=0):
+        
+        """
+        Compute importance sampling estimate of the posterior expectation of
+        an arbitrary function from the archive of proposals and log
+        IS-weights, without evaluating the posterior
+        
+        Inputs:
+        ------
+        Fun         - callable
+                    vectorised function mapping an (Number of states) x d-
+                    dimensional array to (Number of states) or
+                    (Number of states) x k values
+        BurnIn      - int 
+                    Burn-In period
+        
+        Outputs:
+        -------
+        Estimate    - array_like
+                    IS-estimate, of the shape of one value of Fun
+        """            
+        
+        if self.ArchiveDir is None:
+            raise ValueError('Proposals are only archived if ArchiveDir is given')
+        
+        return ArchiveEstimate(self.ArchiveDir, Fun, BurnIn)
+
+
+    def getIS_MeanVarEstimate(self, N, BurnIn=0, Method='batch', BatchSize=None):
+        
+        """
+        Estimate the Monte Carlo variance of the importance sampling mean
+        estimate from this single run by batch means over WeightedSum
+        
+        Inputs:
+        ------
+        N           - int
+                    number of proposals per iteration
+        BurnIn      - int 
+                    Burn-In period
+        Method      - string
+                    either 'batch' (batch means with batch size BatchSize)
+                    or 'cud' (dyadic batch means with fitted rate, suited
+                    for CUD driven runs)
+        BatchSize   - int
+                    iterations per batch for Method='batch'; if None,
+                    floor(sqrt(Number of iterations)) is used
+        
+        Outputs:
+        -------
+        Variance    - array_like
+                    d-dimensional array of variance estimates
+        """            
+        
+        # Without History, online dyadic batch means after the Burn-In of
+        # the run are used
+        if not self.History:
+            return self.Estimates.getVariance(Method, BatchSize)
+        
+        WeightedSum = self.WeightedSum[int(BurnIn/N):,:]
+        
+        if Method == 'batch':
+            Variance = BatchMeansVariance(WeightedSum, BatchSize)
+        elif Method == 'cud':
+            Variance = CudBatchMeansVariance(WeightedSum)[0]
+        else:
+            raise ValueError('Method must be chosen either as "batch" or as "cud"')
+        
+        return Variance
+
+
+    def getIS_FunMeanEstimate(self, N, BurnIn=0):
+        
+        """
+        Compute importance sampling estimates of the functionals Funs
+
+        Inputs:
+        -------   
+        N               - int 
+                        number of proposals per iteration      
+        BurnIn          - int
+                        Burn-In period  
+                
+        Outputs:
+        -------
+        WeightedMeans   - list
+                        IS-estimates, each of the shape of one value of
+                        its functional
+        """            
+        
+        if self.FunSums is None:
+            raise ValueError('Functionals are only estimated if Funs is given')
+        
+        # Without History, the Burn-In of the run applies
+        WeightedMeans = self.FunSums.getMean(int(BurnIn/N))
+        
+        return WeightedMeans
+
+
     def getWeighted_Sums(self, N, BurnIn=0):
         
         """
@@ -282,33 +555,179 @@ class BayesianLinReg:
                         d-dimensional array
         """            
         
+        if not self.History:
+            raise ValueError('Weighted sums are only stored if History=True')
+        
         WeightedSums = self.WeightedSum[int(BurnIn/N):,:]
         
         return WeightedSums
     
       
-    def getMarginalHistogram(self, Index=0, BarNum=100, BurnIn=0):
+    def getMarginalDensity(self):
         
         """
-        Plot histogram of marginal distribution for posterior samples using 
-        MP-QMCMC
+        IS-weighted marginal densities of all coordinates, accumulated
+        during the run after Burn-In
+        
+        Outputs:
+        -------
+        Edges   - array_like
+                d x (NumOfBins+1)-dimensional array of bin edges
+        Density - array_like
+                d x NumOfBins-dimensional array of densities
+        """
+        
+        if self.Histogram is None:
+            raise ValueError('Marginals are only accumulated if NumOfBins is given')
+        
+        return self.Histogram.getDensity()
+
+
+    def getMarginalQuantiles(self, Probs):
+        
+        """
+        IS-weighted marginal quantiles of all coordinates, accumulated
+        during the run after Burn-In
+        
+        Inputs:
+        ------
+        Probs       - array_like
+                    probabilities in [0,1]
+        
+        Outputs:
+        -------
+        Quantiles   - array_like
+                    (Number of probabilities) x d-dimensional array
+        """
+        
+        if self.Histogram is None:
+            raise ValueError('Marginals are only accumulated if NumOfBins is given')
+        
+        return self.Digest.getQuantiles(Probs)
+
+
+    def getMarginalHistogram(self, Index=0, BarNum=None, BurnIn=None):
+        
+        """
+        Plot histogram of the marginal distribution of one coordinate. With
+        History, it is formed from the stored samples of MP-QMCMC; without
+        History, the IS-weighted histogram accumulated during the run is
+        plotted, which is fixed to the NumOfBins and Burn-In of the run,
+        see getMarginalDensity
         
         Inputs:
         ------
         Index   - int
                 index of dimension for marginal distribution
+        BarNum  - int
+                number of bins; if None, 100 with History and NumOfBins
+                of the run otherwise
         BurnIn  - int
-                Burn-In period
+                Burn-In period; if None, 0 with History and Burn-In of the
+                run otherwise
         
         Outputs:
         -------
         Plot
         """         
 
+        # Without History, only the IS-weighted histogram accumulated after
+        # the Burn-In of the run is available
+        if not self.History:
+            if self.Histogram is None:
+                raise ValueError('Without History, marginals are only available if NumOfBins is given')
+            if BarNum not in (None, self.NumOfBins) or BurnIn not in (None, self.BurnIn):
+                raise ValueError('Without History, the marginal histogram is fixed to ' \
+                                 'NumOfBins={} and BurnIn={} of the run'.format( \
+                                 self.NumOfBins, self.BurnIn))
+            Edges, Density = self.Histogram.getDensity()
+            return PlotMarginalDensity(Edges[Index], Density[Index])
+
+        if BarNum is None:
+            BarNum = 100
+        if BurnIn is None:
+            BurnIn = 0
+        States, Counts = self.getSampleCounts(BurnIn)
         Fig = plt.figure()
         SubPlot = Fig.add_subplot(111)
-        SubPlot.hist(self.getSamples(BurnIn)[:,Index], BarNum, label = "PDF Histogram", density = True)
+        SubPlot.hist(States[:,Index], BarNum, weights = Counts, label = "PDF Histogram", \
+                     density = True)
         
         return Fig
 
 
+def SmMALAPrecomputation(X, Obs, alpha, InvFisherInfo, StepSize, CovScaling):
+
+    """
+    Cholesky factor of the proposal covariance and affine Langevin drift map
+    of the SmMALA kernel with constant metric. The gradient of the
+    log-posterior is alpha X^T Obs - FisherInfo x, so that the drift mean
+    x + StepSize^2/2 InvFisherInfo GradLog(x) of any state is
+    DriftScale x + DriftShift, without a pass over the data
+
+    Inputs:
+    ------
+    X               - array_like
+                    (Number of observations) x d-dimensional design matrix
+    Obs             - array_like
+                    observations
+    alpha           - float
+                    precision of observation noise
+    InvFisherInfo   - array_like
+                    dxd-dimensional inverse of constant metric tensor
+    StepSize        - float
+                    step size for proposed jump in mean
+    CovScaling      - float
+                    scaling of proposal covariance
+
+    Outputs:
+    -------
+    CholPropCov     - array_like
+                    dxd-dimensional (upper) Cholesky factor of proposal
+                    covariance
+    DriftScale      - float
+                    scaling of states in drift mean
+    DriftShift      - array_like
+                    d-dimensional shift of drift mean
+    """
+
+    CholPropCov = np.linalg.cholesky(CovScaling**2*InvFisherInfo).T
+    DriftScale = 1. - StepSize**2/2.
+    DriftShift = StepSize**2/2.*alpha*np.dot(InvFisherInfo, np.dot(X.T, Obs))
+
+    return CholPropCov, DriftScale, DriftShift
+
+
+def SmMALADrift(Normals, Mean_xI, CholPropCov, DriftScale, DriftShift):
+
+    """
+    Auxiliary state z drawn around the drift mean of the current state,
+    N-1 proposals drawn around the drift mean of z, and the drift means of
+    z and of all proposals in one batch
+
+    Inputs:
+    ------
+    Normals         - array_like
+                    N x d-dimensional array of standard normal variates
+    Mean_xI         - array_like
+                    d-dimensional drift mean of current state
+    CholPropCov, DriftScale, DriftShift
+                    outputs of SmMALAPrecomputation
+
+    Outputs:
+    -------
+    z               - array_like
+                    d-dimensional auxiliary state
+    Mean_z          - array_like
+                    d-dimensional drift mean of z
+    y               - array_like
+                    (N-1) x d-dimensional array of proposals
+    Mean_y          - array_like
+                    (N-1) x d-dimensional array of drift means of proposals
+    """
+
+    z = Mean_xI + np.dot(Normals[0], CholPropCov)
+    Mean_z = DriftScale*z + DriftShift
+    y = Mean_z + np.dot(Normals[1:], CholPropCov)
+
+    return z, Mean_z, y, DriftScale*y + DriftShift
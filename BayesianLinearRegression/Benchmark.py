@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to benchmark the SmMALA sampler of the linear Bayesian regression.
+The drift kernel of one iteration, as used by BayesianLinReg_SmMALA, is
+compared against the implementation it replaces, with separate gradient
+passes over the data and Cholesky factorisations in every iteration, both
+in run time and in result; the run time per iteration of the whole sampler
+is measured as well.
+"""
+
+import time
+import numpy as np
+from BayesianLinReg_SmMALA import BayesianLinReg, SmMALAPrecomputation, SmMALADrift
+
+
+def TimeIt(Fun, *Args, Repeats=10):
+
+    """
+    Measures the minimal wall time of Repeats calls of Fun(*Args)
+
+    Inputs:
+    ------
+    Fun         - callable
+                function to be timed
+    Args        - tuple
+                arguments passed to Fun
+    Repeats     - int
+                number of timed calls
+
+    Outputs:
+    -------
+    Time        - float
+                minimal time of a single call in seconds
+    Result      - any
+                return value of the last call
+    """
+
+    Times = np.zeros(Repeats)
+    for r in range(Repeats):
+        StartTime = time.perf_counter()
+        Result = Fun(*Args)
+        Times[r] = time.perf_counter() - StartTime
+
+    return np.min(Times), Result
+
+
+def ReferenceSmMALADrift(X, Obs, alpha, InvG_prior, InvFisherInfo, StepSize, CovScaling, \
+                         Normals, xI, I):
+
+    """
+    Auxiliary state, proposals and drift means of one iteration as computed
+    originally by BayesianLinReg_SmMALA, with two Cholesky factorisations of
+    the metric and separate gradient passes over the data for xI, z and all
+    states
+    """
+
+    GradLog_xI = -np.dot(InvG_prior,xI) + alpha * np.dot(X.T, (Obs - np.dot(X, xI)))
+    Mean_xI = xI + StepSize**2/2.*np.dot(InvFisherInfo,GradLog_xI)
+    z = Mean_xI + np.dot(Normals[0], np.linalg.cholesky(CovScaling**2*InvFisherInfo).T)
+    GradLog_z = -np.dot(InvG_prior,z) + alpha * np.dot(X.T, (Obs - np.dot(X, z)))
+    Mean_z = z + StepSize**2/2.*np.dot(InvFisherInfo,GradLog_z)
+    y = Mean_z + np.dot(Normals[1:], np.linalg.cholesky(CovScaling**2*InvFisherInfo).T)
+    Proposals = np.insert(y, I, xI, axis=0)
+    GradLog_states = - np.dot(InvG_prior,Proposals.T) \
+                     + alpha * np.dot(X.T, (Obs - np.dot(X, Proposals.T).T).T)
+    Mean_Proposals = Proposals + StepSize**2/2.*np.dot(InvFisherInfo,GradLog_states).T
+
+    return z, Mean_z, y, np.delete(Mean_Proposals, I, axis=0)
+
+
+def DriftBenchmark(m, N, d, alpha=1., StepSize=1., CovScaling=1., Repeats=10):
+
+    """
+    Compares the drift kernel SmMALADrift of BayesianLinReg_SmMALA, with the
+    drift mean of the current state carried over, with the reference
+    implementation for a synthetic data set of m observations and N states
+    of dimension d, and prints the time per iteration, the time of
+    SmMALAPrecomputation per run and the maximal relative deviation
+    """
+
+    Rng = np.random.RandomState(1)
+    X = Rng.standard_normal((m,d))
+    Obs = np.dot(X, np.ones(d)) + Rng.standard_normal(m)/np.sqrt(alpha)
+    InvG_prior = alpha/m*np.dot(X.T,X) # Zellner's g-prior with g = 1/m
+    FisherInfo = InvG_prior + alpha*np.dot(X.T,X)
+    InvFisherInfo = np.linalg.inv(FisherInfo)
+    Normals = Rng.standard_normal((N,d))
+    xI = np.linalg.solve(FisherInfo, alpha*np.dot(X.T, Obs)) + Rng.standard_normal(d)/np.sqrt(m)
+    I = int(N/2)
+
+    PreTime, (CholPropCov, DriftScale, DriftShift) = TimeIt(SmMALAPrecomputation, \
+                    X, Obs, alpha, InvFisherInfo, StepSize, CovScaling, Repeats=Repeats)
+    Mean_xI = DriftScale*xI + DriftShift
+    RefTime, RefResults = TimeIt(ReferenceSmMALADrift, X, Obs, alpha, InvG_prior, \
+                    InvFisherInfo, StepSize, CovScaling, Normals, xI, I, Repeats=Repeats)
+    Time, Results = TimeIt(SmMALADrift, Normals, Mean_xI, CholPropCov, DriftScale, \
+                    DriftShift, Repeats=Repeats)
+    Deviation = max([np.max(np.abs(Result-RefResult))/np.max(np.abs(RefResult)) \
+                     for Result, RefResult in zip(Results, RefResults)])
+    print ("m={:>7} N={:>5} d={:>4}: reference {:.3e}s, SmMALADrift {:.3e}s per iteration "\
+           "(and {:.3e}s per run), max rel. deviation {:.1e}".format(m, N, d, RefTime, \
+           Time, PreTime, Deviation))
+
+
+def SamplerBenchmark(N, d, PowerOfTwo=14, Repeats=3):
+
+    """
+    Measures the run time per iteration of BayesianLinReg_SmMALA for N
+    states of dimension d (data generated by DataGen)
+    """
+
+    x0 = np.zeros(d)
+    Time = TimeIt(BayesianLinReg, d, 1., x0, N, 1., 1., PowerOfTwo, 'iid', \
+                  Repeats=Repeats)[0]
+    NumOfIter = int(int((2**PowerOfTwo-1)/(d+1))*(d+1)/(N+1))
+    print ("N={:>5} d={:>4}: sampler {:.3e}s per iteration".format(N, d, Time/NumOfIter))
+
+
+if __name__ == '__main__':
+
+    #############################
+    # Parameters for benchmarks #
+    #############################
+
+    d           = 25             # Dimension of synthetic data
+
+
+    ##########################
+    # Drift kernel of SmMALA #
+    ##########################
+
+    print ("SmMALA drift means of one iteration:")
+    for NumOfObs in [10**3, 10**5]:
+        for NumOfProposals in [4, 64, 1024]:
+            DriftBenchmark(NumOfObs, NumOfProposals, d)
+
+
+    ##################
+    # SmMALA sampler #
+    ##################
+
+    print ("SmMALA sampler:")
+    for NumOfProposals in [4, 64, 1024]:
+        for Dimension in [3, d]:
+            SamplerBenchmark(NumOfProposals, Dimension)
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to store the samples and acceptance values of a run of MP-(Q)MCMC.
+Rows are written into one preallocated contiguous array, or streamed into
+.npy files opened as memmaps for runs that exceed the available memory, so
+that samples can be returned as views without copying. Alternatively, the
+states drawn in each iteration are stored only once, together with small
+per-sample indices into them; samples are then expanded lazily, and
+weighted statistics are computed from the counts of the stored states.
+Weighted sums of user-supplied functionals of the proposals are formed in
+the same pass, stored per iteration or accumulated online.
+All proposals and their log IS-weights can further be archived on disk, in
+a new or empty directory, so that IS-estimates of new functions are
+obtained after the run without any evaluation of the posterior.
+"""
+
+import os
+import glob
+import numpy as np
+from BatchMeans import OnlineBatchMeans
+
+
+class SampleBuffer:
+
+    def __init__(self, NumOfSamples, d, SampleFile=None):
+
+        """
+        Inputs:
+        -------
+        NumOfSamples    - int
+                        maximal number of samples
+        d               - int
+                        dimension of samples
+        SampleFile      - string
+                        if given, samples are written to this .npy file and
+                        acceptance values to the file with suffix '_accept'
+                        (as memmaps) instead of being kept in memory
+        """
+
+        if SampleFile is None:
+            self.Samples = np.empty((NumOfSamples,d))
+            self.AcceptVals = np.empty(NumOfSamples)
+        else:
+            AcceptFile = '{}_accept.npy'.format(os.path.splitext(SampleFile)[0])
+            self.Samples = np.lib.format.open_memmap(SampleFile, mode='w+', \
+                                        dtype=float, shape=(NumOfSamples,d))
+            self.AcceptVals = np.lib.format.open_memmap(AcceptFile, mode='w+', \
+                                        dtype=float, shape=(NumOfSamples,))
+        self.n = 0
+
+
+    def append(self, States, Is, AcceptVals):
+
+        """
+        Writes the states with indices Is and their acceptance values
+
+        Inputs:
+        -------
+        States          - array_like
+                        (N+1) x d-dimensional array of states
+        Is              - array_like
+                        indices of sampled states
+        AcceptVals      - array_like
+                        acceptance values of sampled states
+        """
+
+        k = len(Is)
+        np.take(States, Is, axis=0, out=self.Samples[self.n:self.n+k])
+        self.AcceptVals[self.n:self.n+k] = AcceptVals
+        self.n += k
+
+
+    def flush(self):
+
+        """
+        Writes memmapped samples to disk
+        """
+
+        if isinstance(self.Samples, np.memmap):
+            self.Samples.flush()
+            self.AcceptVals.flush()
+
+
+    def getSamples(self, BurnIn=0):
+        return self.Samples[BurnIn:self.n]
+
+    def getAcceptVals(self, BurnIn=0):
+        return self.AcceptVals[BurnIn:self.n]
+
+    def getAcceptRate(self, BurnIn=0):
+        return np.mean(self.getAcceptVals(BurnIn))
+
+    def getCounts(self, BurnIn=0):
+        return self.getSamples(BurnIn), np.ones(self.n-BurnIn, dtype=np.uint32)
+
+
+class CountSampleBuffer:
+
+    def __init__(self, NumOfIter, SamplesPerIter, d, NumOfStates):
+
+        """
+        Stores the distinct states drawn in each iteration once, with their
+        acceptance values, and for every sample the index of its state among
+        the distinct states of its iteration (uint16 for up to 2^16 states
+        per iteration)
+
+        Inputs:
+        -------
+        NumOfIter       - int
+                        maximal number of iterations
+        SamplesPerIter  - int
+                        number of samples drawn per iteration
+        d               - int
+                        dimension of samples
+        NumOfStates     - int
+                        number of states per iteration (N+1)
+        """
+
+        self.k = SamplesPerIter
+        self.States = np.empty((NumOfIter,d))
+        self.StateAcceptVals = np.empty(NumOfIter)
+        self.Offsets = np.zeros(NumOfIter+1, dtype=np.int64)
+        IndexType = np.uint16 if NumOfStates <= 2**16 else np.uint32
+        self.Indices = np.empty(NumOfIter*SamplesPerIter, dtype=IndexType)
+        self.n = 0
+
+
+    def append(self, States, Is, AcceptVals):
+
+        """
+        Writes the distinct states among those with indices Is, their
+        acceptance values and the indices of all samples
+
+        Inputs:
+        -------
+        States          - array_like
+                        (N+1) x d-dimensional array of states
+        Is              - array_like
+                        indices of sampled states
+        AcceptVals      - array_like
+                        acceptance values of sampled states
+        """
+
+        Unique, First, Inverse = np.unique(Is, return_index=True, return_inverse=True)
+        Start = self.Offsets[self.n]
+        End = Start + len(Unique)
+
+        # Double storage of distinct states if full
+        if End > len(self.States):
+            Size = max(2*len(self.States), End)
+            self.States = np.resize(self.States, (Size, self.States.shape[1]))
+            self.StateAcceptVals = np.resize(self.StateAcceptVals, Size)
+
+        self.States[Start:End] = States[Unique]
+        self.StateAcceptVals[Start:End] = AcceptVals[First]
+        self.Indices[self.n*self.k:(self.n+1)*self.k] = Inverse.ravel()
+        self.n += 1
+        self.Offsets[self.n] = End
+
+
+    def flush(self):
+        pass
+
+
+    def getRows(self, BurnIn=0):
+
+        """
+        Rows of the stored states of all samples after Burn-In
+        """
+
+        Samples = np.arange(BurnIn, self.n*self.k)
+        return self.Offsets[Samples//self.k] + self.Indices[BurnIn:self.n*self.k]
+
+
+    def getSamples(self, BurnIn=0):
+        return self.States[self.getRows(BurnIn)]
+
+    def getAcceptVals(self, BurnIn=0):
+        return self.StateAcceptVals[self.getRows(BurnIn)]
+
+    def getAcceptRate(self, BurnIn=0):
+        States, Counts = self.getCounts(BurnIn)
+        return np.dot(Counts, self.StateAcceptVals[:len(Counts)])/np.sum(Counts)
+
+    def getCounts(self, BurnIn=0):
+
+        """
+        Distinct stored states and their numbers of occurrences among the
+        samples after Burn-In
+        """
+
+        NumOfRows = self.Offsets[self.n]
+        Counts = np.bincount(self.getRows(BurnIn), minlength=NumOfRows)
+
+        return self.States[:NumOfRows], Counts
+
+
+class FunctionalSums:
+
+    def __init__(self, Funs, NumOfIter, History=True):
+
+        """
+        Per-iteration IS-weighted sums of a list of vectorised functionals
+        of the proposals, evaluated once per iteration; values of all
+        functionals are stacked into one row, which is stored (History=True)
+        or accumulated by online batch means
+
+        Inputs:
+        -------
+        Funs            - list
+                        vectorised functions mapping the (N+1) x d-
+                        dimensional array of proposals to (N+1) or
+                        (N+1) x k values
+        NumOfIter       - int
+                        maximal number of iterations
+        History         - bool
+                        store weighted sums of all iterations
+        """
+
+        self.Funs = Funs
+        self.NumOfIter = NumOfIter
+        self.History = History
+        self.Shapes = None
+        self.n = 0
+
+
+    def add(self, Proposals, Pstates):
+
+        """
+        Adds the weighted sums of all functionals for one iteration
+
+        Inputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of proposals
+        Pstates         - array_like
+                        (N+1)-dimensional array of normalised IS-weights
+        """
+
+        Values = [np.asarray(Fun(Proposals)) for Fun in self.Funs]
+
+        # Allocate storage once the shapes of values are known
+        if self.Shapes is None:
+            self.Shapes = [Value.shape[1:] for Value in Values]
+            self.Offsets = np.cumsum([int(np.prod(Shape)) for Shape in self.Shapes])
+            if self.History:
+                self.Sums = np.empty((self.NumOfIter,self.Offsets[-1]))
+            else:
+                self.Estimates = OnlineBatchMeans(self.Offsets[-1])
+
+        Values = np.concatenate([Value.reshape(len(Pstates),-1) for Value in Values], \
+                                axis=1)
+        if self.History:
+            np.dot(Pstates, Values, out=self.Sums[self.n])
+        else:
+            self.Estimates.add(np.dot(Pstates, Values))
+        self.n += 1
+
+
+    def getMean(self, Start=0):
+
+        """
+        IS-estimates of all functionals, each of the shape of one value of
+        its functional, from the iterations after Start
+        """
+
+        if self.n == 0:
+            raise ValueError('No weighted sums of functionals accumulated')
+
+        if self.History:
+            Mean = np.mean(self.Sums[Start:self.n], axis=0)
+        else:
+            Mean = self.Estimates.getMean()
+
+        return [Estimate.reshape(Shape) for Estimate, Shape in \
+                zip(np.split(Mean, self.Offsets[:-1]), self.Shapes)]
+
+
+class ProposalArchive:
+
+    def __init__(self, Directory, SamplesPerIter, ChunkSize=2**12):
+
+        """
+        Archive of the proposals and normalised log IS-weights of all
+        iterations, written as float32 .npy files of ChunkSize iterations
+        each into a new or empty directory, together with the number of
+        samples per iteration, by which Burn-In is converted to iterations
+
+        Inputs:
+        -------
+        Directory       - string
+                        directory of archive files; must not contain files
+        SamplesPerIter  - int
+                        number of samples drawn per iteration (N)
+        ChunkSize       - int
+                        number of iterations per file
+        """
+
+        if os.path.isdir(Directory) and len(os.listdir(Directory)) > 0:
+            raise ValueError('Archive directory {} is not empty'.format(Directory))
+
+        self.Directory = Directory
+        self.ChunkSize = ChunkSize
+        os.makedirs(Directory, exist_ok=True)
+        np.savetxt(os.path.join(Directory, 'SamplesPerIter.txt'), [SamplesPerIter], fmt='%d')
+
+        self.Proposals = list()
+        self.LogWeights = list()
+        self.NumOfChunks = 0
+
+
+    def append(self, Proposals, LogWeights):
+
+        """
+        Adds the proposals and normalised log IS-weights of one iteration
+
+        Inputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of proposals
+        LogWeights      - array_like
+                        (N+1)-dimensional array of normalised log IS-weights
+        """
+
+        self.Proposals.append(Proposals.astype(np.float32))
+        self.LogWeights.append(LogWeights.astype(np.float32))
+        if len(self.Proposals) == self.ChunkSize:
+            self.flush()
+
+
+    def flush(self):
+
+        """
+        Writes buffered iterations to a new archive file
+        """
+
+        if len(self.Proposals) == 0:
+            return
+
+        Name = os.path.join(self.Directory, '{}_{:06d}.npy')
+        np.save(Name.format('Proposals', self.NumOfChunks), np.array(self.Proposals))
+        np.save(Name.format('LogWeights', self.NumOfChunks), np.array(self.LogWeights))
+        self.Proposals = list()
+        self.LogWeights = list()
+        self.NumOfChunks += 1
+
+
+def ArchiveEstimate(Directory, Fun, BurnIn=0):
+
+    """
+    Computes the IS-estimate of the posterior expectation of a function from
+    an archive of proposals and log IS-weights, in one pass over its files
+
+    Inputs:
+    -------
+    Directory       - string
+                    directory of archive files
+    Fun             - callable
+                    vectorised function mapping an (Number of states) x d-
+                    dimensional array to an array of (Number of states) or
+                    (Number of states) x k values
+    BurnIn          - int
+                    Burn-In period; the first int(BurnIn/N) iterations are
+                    discarded, with the number N of samples per iteration
+                    stored in the archive
+
+    Outputs:
+    -------
+    Estimate        - array_like
+                    IS-estimate, of the shape of one value of Fun
+    """
+
+    Files = sorted(glob.glob(os.path.join(Directory, 'Proposals_[0-9]*.npy')))
+    if len(Files) == 0:
+        raise ValueError('No archive found in {}'.format(Directory))
+
+    Sum = 0.
+    NumOfIter = 0
+    Skip = int(BurnIn/int(np.loadtxt(os.path.join(Directory, 'SamplesPerIter.txt'))))
+    for File in Files:
+        Proposals = np.load(File)
+        LogWeights = np.load(File.replace('Proposals_', 'LogWeights_'))
+        [n,NumOfStates,d] = Proposals.shape
+
+        # Discard iterations of Burn-In
+        Proposals = Proposals[Skip:]
+        LogWeights = LogWeights[Skip:]
+        Skip = max(Skip-n, 0)
+        if len(Proposals) == 0:
+            continue
+
+        Values = np.asarray(Fun(Proposals.reshape(-1,d).astype(float)))
+        Weights = np.exp(LogWeights.reshape(-1).astype(float))
+        Sum = Sum + np.tensordot(Weights, Values, axes=(0,0))
+        NumOfIter += len(Proposals)
+
+    return Sum/NumOfIter
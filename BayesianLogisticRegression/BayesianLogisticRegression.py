@@ -13,7 +13,16 @@ import numpy as np
 import matplotlib.pyplot as plt
 from StudentT import multivariate_t_rvs_custom_seed, multivariate_t_LogPdf
 from Data import DataLoad
+from Likelihood import LogisticLikelihood, ParallelLogisticLikelihood, \
+                       SubsampledLogisticLikelihood
+from Laplace import LaplaceApprox
+from Coreset import Coreset
 from Seed import SeedGen
+from Storage import SampleBuffer, CountSampleBuffer, ProposalArchive, \
+                    ArchiveEstimate, FunctionalSums
+from Marginals import WeightedHistogram, WeightedDigest, PlotMarginalDensity
+from Workspace import IterationWorkspace
+from BatchMeans import BatchMeansVariance, CudBatchMeansVariance, OnlineBatchMeans
 #from Seed_digShift import SeedGen
 
 
@@ -21,7 +30,13 @@ class BayesianLogReg:
     
 
     def __init__(self, N, StepSize, PowerOfTwo, \
-                 InitMean, InitCov, df, Case, alpha=100., Stream='cud', WeightIn=0):
+                 InitMean, InitCov, df, Case, alpha=100., Stream='cud', WeightIn=0, \
+                 AdaptIter=0, AdaptSignal='accept', MemoryMap=False, MaxMemory=None, \
+                 Data=None, Cuds=None, NumOfWorkers=1, Deduplicate=False, \
+                 CoresetSize=None, ScreenTol=None, SubsampleSize=None, \
+                 History=True, BurnIn=0, SampleFile=None, \
+                 CountSamples=False, ArchiveDir=None, Funs=None, \
+                 NumOfBins=None):
         
         """
         Implements the Bayesian Logistic Regression based on the
@@ -50,153 +65,440 @@ class BayesianLogReg:
                         either 'cud' or 'iid'; defining what seed is used       
         WeightIn        - float
                         if BurnIn-run existed, weight initial esitmates
-                        by int(WeightIn/N)-times
+                        by int(WeightIn/N)-times in the proposal mean and
+                        covariance; they do not enter the IS-estimates
+        AdaptIter       - int
+                        number of initial iterations during which StepSize
+                        is tuned by stochastic approximation within a
+                        factor 2 of the initial StepSize; StepSize is
+                        frozen afterwards (0 = no adaptation)
+        AdaptSignal     - string
+                        either 'accept' or 'ess'; streaming signal that is
+                        maximised during adaptation (acceptance rate or
+                        effective sample size of IS-weights)
+        MemoryMap       - bool
+                        keep design matrix on disk as read-only memmap
+        MaxMemory       - int
+                        bound in bytes on temporaries of likelihood
+                        evaluation per row chunk (None = no chunking)
+        Data            - DataLoad
+                        preloaded data (e.g. SharedDataLoad attached from
+                        shared memory); if None, data is loaded from Case
+        Cuds            - array_like
+                        preloaded unshifted (d+2)-dimensional cud seed
+                        (e.g. from shared memory), used for Stream='cud';
+                        a random shift is applied per iteration
+        NumOfWorkers    - int
+                        number of worker processes across which the rows
+                        of the design matrix are split for likelihood
+                        evaluation (1 = serial; None = all CPUs)
+        Deduplicate     - bool
+                        evaluate the likelihood over distinct rows of the
+                        data weighted by their multiplicities
+        CoresetSize     - int
+                        if given, the likelihood is evaluated on a weighted
+                        coreset of (at most) CoresetSize rows drawn by
+                        sensitivity sampling from the Laplace approximation;
+                        the error of its log-likelihood differences over the
+                        posterior bulk is printed and kept in CoresetError
+        ScreenTol       - float
+                        if given, proposals are screened by a Gaussian
+                        surrogate of the posterior with mean InitMean and
+                        covariance InitCov (e.g. the Laplace approximation):
+                        the likelihood of a proposal with normalised
+                        surrogate weight w is only evaluated with probability
+                        min(1, w/ScreenTol), and its weight is divided by
+                        that probability, which keeps the IS-estimates
+                        consistent; should be at most 1/(N+1)
+        SubsampleSize   - int
+                        if given, log-likelihoods are estimated from
+                        SubsampleSize random rows per iteration, with a
+                        second order Taylor expansion around the posterior
+                        mode (Laplace approximation) as control variate;
+                        the IS-weights, exponentials of these unbiased
+                        estimates, are biased, so that SubsampleSize must
+                        keep the estimates' variance small over the
+                        posterior bulk, see SubsampledLogisticLikelihood
+        History         - bool
+                        store samples, acceptance values and per-iteration
+                        weighted sums and covariances; if False, only
+                        running accumulators of the IS-estimates, their
+                        batch means and the acceptance rate are kept, with
+                        memory independent of the run length
+        BurnIn          - int
+                        Burn-In period excluded from the accumulators if
+                        History=False, counted in samples of the sampling
+                        iterations only and applied to all IS-estimates,
+                        ESS and marginals alike, regardless of WeightIn
+                        (with History=True, Burn-In is chosen
+                        when calling the get-methods; the marginal
+                        accumulators always exclude it)
+        SampleFile      - string
+                        if given (and History=True), samples and acceptance
+                        values are streamed into .npy memmaps at this path
+                        instead of being kept in memory
+        CountSamples    - bool
+                        if True (and History=True), the distinct states
+                        drawn per iteration are stored once with per-sample
+                        indices; samples are expanded lazily by
+                        getSamples, weighted statistics use getSampleCounts
+        ArchiveDir      - string
+                        if given, all proposals and their log IS-weights
+                        are archived as float32 files in this (new or
+                        empty) directory, see getIS_ArchiveEstimate
+        Funs            - list
+                        vectorised functions mapping the (N+1) x d-
+                        dimensional array of proposals to (N+1) or
+                        (N+1) x k values; their IS-estimates are
+                        accumulated in the same pass, see
+                        getIS_FunMeanEstimate
+        NumOfBins       - int
+                        if given, IS-weighted marginal histograms with
+                        NumOfBins bins and quantile digests of all
+                        coordinates are accumulated from the proposals,
+                        see getMarginalDensity and getMarginalQuantiles
         """
     
         #############
         # Load Data #
         #############
         
-        Data        = DataLoad(Case)
+        if Data is None:
+            Data    = DataLoad(Case, MemoryMap=MemoryMap, Deduplicate=Deduplicate)
+
+        # Optionally compress data to a weighted coreset
+        if CoresetSize is not None:
+            Data    = Coreset(Data, LaplaceApprox(Data, alpha), CoresetSize)
+            self.CoresetError = Data.getDiagnostic(MaxMemory=MaxMemory)
+            print ('Coreset of {} rows: max/mean error of log-likelihood differences = '\
+                   '{:.3g}/{:.3g}'.format(Data.getNumOfSamples(), *self.CoresetError))
         d           = Data.getDimension()
         XX          = Data.getDesignMatrix()
         t           = Data.getResponses()
+        Weights     = Data.getWeights()
+        
+        # Log-likelihood accumulated over row chunks of XX, optionally
+        # over row blocks held by parallel worker processes, or estimated
+        # from subsamples of rows
+        if SubsampleSize is not None:
+            LogLikelihood = SubsampledLogisticLikelihood(XX, t, \
+                                LaplaceApprox(Data, alpha).getMean(), SubsampleSize, Weights)
+            NumOfWorkers = 1
+        elif NumOfWorkers == 1:
+            LogLikelihood = LogisticLikelihood(XX, t, MaxMemory, Weights)
+        else:
+            LogLikelihood = ParallelLogisticLikelihood(XX, t, NumOfWorkers, MaxMemory, \
+                                                       Weights)
 
         
-        ##################################
-        # Choose stream for Markoc Chain #
-        ##################################
+        # Stop likelihood workers on every exit of the simulation,
+        # including exceptions and interrupts
+        try:
+
+            ##################################
+            # Choose stream for Markoc Chain #
+            ##################################
     
-        xs = SeedGen(d+2, PowerOfTwo, Stream)
+            if Cuds is not None and Stream == 'cud':
+                # Shift shared seed lazily instead of copying it
+                xs = Cuds
+                Shift = np.random.uniform(0,1,1)
+            else:
+                xs = SeedGen(d+2, PowerOfTwo, Stream)
+                Shift = None
     
          
-        ##################
-        # Initialisation #
-        ##################
-    
-        # List of samples to be collected
-        self.xVals = list()
-        self.xVals.append(InitMean)
+            ##################
+            # Initialisation #
+            ##################
     
-        # Iteration number
-        NumOfIter = int(int((2**PowerOfTwo-1)/(d+2))*(d+2)/N)
-        print ('Total number of Iterations = ', NumOfIter)
+            # Iteration number
+            NumOfIter = int(int((2**PowerOfTwo-1)/(d+2))*(d+2)/N)
+            print ('Total number of Iterations = ', NumOfIter)
     
-        # Set up acceptance rate array
-        self.AcceptVals = list()
-    
-        # Initialise
-        xI = self.xVals[0]
-        I = 0
-
-        # Number of iterations used for initial approximated posterior mean
-        M = int(WeightIn/N)+1
-        
-        # Weighted Sum and Covariance Arrays
-        self.WeightedSum = np.zeros((NumOfIter+M,d))
-        self.WeightedCov = np.zeros((NumOfIter+M,d,d)) 
-        self.WeightedSum[0:M,:] = InitMean
-        self.WeightedCov[0:M,:] = InitCov        
+            # Initialise
+            xI = InitMean
+            I = 0
+
+            # Number of iterations used for initial approximated posterior mean
+            M = int(WeightIn/N)+1
+        
+            # Archive of proposals and log IS-weights
+            self.ArchiveDir = ArchiveDir
+            if ArchiveDir is not None:
+                Archive = ProposalArchive(ArchiveDir, N)
+
+            # Weighted sums of functionals of proposals
+            self.FunSums = None
+            if Funs is not None:
+                self.FunSums = FunctionalSums(Funs, NumOfIter, History)
+
+            # Streaming IS-weighted marginal histograms and quantiles
+            self.Histogram = None
+            self.NumOfBins = NumOfBins
+            self.BurnIn = BurnIn
+            if NumOfBins is not None:
+                self.Histogram = WeightedHistogram(d, NumOfBins)
+                self.Digest = WeightedDigest(d)
+
+            self.History = History
+            if History:
+                # Preallocated buffer of samples and acceptance values
+                if CountSamples:
+                    self.Buffer = CountSampleBuffer(NumOfIter, N-1, d, N+1)
+                else:
+                    self.Buffer = SampleBuffer(NumOfIter*(N-1), d, SampleFile)
+        
+                # Weighted Sum and Covariance Arrays
+                self.WeightedSum = np.zeros((NumOfIter,d))
+                self.WeightedCov = np.zeros((NumOfIter,d,d))        
+                self.WeightESS = np.zeros(NumOfIter)
+            else:
+                # Running IS-estimates and acceptance rate after Burn-In
+                Start           = int(BurnIn/N)
+                self.Estimates  = OnlineBatchMeans(d)
+                self.CovSum     = np.zeros((d,d))
+                self.AcceptSum  = 0.
+                self.NumOfAccepts = 0
+                self.WeightESSSum = 0.
+                self.NumOfWeightESS = 0
+
+            # Running sums of weighted sums and covariances for proposal,
+            # counting initial estimates as first M iterations
+            self.SumWeightedSum = M*InitMean
+            self.SumWeightedCov = M*InitCov
     
-        # Approximate Posterior Mean and Covariance as initial estimates
-        self.ApprPostMean = InitMean
-        self.ApprPostCov  = InitCov
+            # Approximate Posterior Mean and Covariance as initial estimates
+            self.ApprPostMean = InitMean
+            self.ApprPostCov  = InitCov
         
-        # Cholesky decomposition of initial Approximate Posterior Covariance
-        CholApprPostCov   = np.linalg.cholesky(self.ApprPostCov)
+            # Cholesky decomposition of initial Approximate Posterior Covariance
+            CholApprPostCov   = np.linalg.cholesky(self.ApprPostCov)
+
+            # Step size adaptation: finite difference stochastic approximation
+            # in log(StepSize), using alternating perturbations +/- AdaptPerturb
+            if AdaptSignal not in ('accept', 'ess'):
+                raise ValueError('AdaptSignal must be chosen either as "accept" or as "ess"')
+            AdaptIter       = 2*int(AdaptIter/2)
+            AdaptPerturb    = 0.05
+            AdaptGain       = 0.1
+            LogStepSize     = np.log(StepSize)
+            LogStepSizeMin  = LogStepSize - np.log(2.)
+            LogStepSizeMax  = LogStepSize + np.log(2.)
+            LogStepSizes    = list()
+            self.StepSize   = StepSize
+
+            # Precision of Gaussian surrogate for screening of proposals
+            if ScreenTol is not None:
+                SurrogatePrec = np.linalg.inv(InitCov)
+            self.NumOfEvaluations = 0
+
+            # Preallocated arrays of iterations and prior precision
+            Workspace       = IterationWorkspace(N, d)
+            PriorPrec       = np.identity(d)/alpha
+
+            # Log-posterior of the current state is carried over between
+            # iterations, so that only the N new proposals are evaluated; a
+            # subsampled likelihood is evaluated for all states, since its
+            # estimates must share the subsample of the iteration
+            First           = 1 if SubsampleSize is None else 0
+            if First == 1:
+                LogPosterior_xI = -0.5*np.dot(xI, np.dot(PriorPrec, xI)) \
+                                    + LogLikelihood(xI.reshape(1,d))[0]
+                self.NumOfEvaluations += 1
 
     
-        ####################
-        # Start Simulation #
-        ####################
+            ####################
+            # Start Simulation #
+            ####################
     
-        for n in range(NumOfIter):
+            for n in range(NumOfIter):
 
-            ######################
-            # Generate proposals #
-            ######################
+                ######################
+                # Generate proposals #
+                ######################
             
-            # Load stream of points in [0,1]^(d+1)
-            U = xs[n*N:(n+1)*N,:]
+                # Load stream of points in [0,1]^(d+1)
+                U = xs[n*N:(n+1)*N,:]
+                if Shift is not None:
+                    U = U + Shift
+                    U = U - np.floor(U)
             
-            # Sample new proposed States according to multivariate t-distribution    
-            y = multivariate_t_rvs_custom_seed(U[:,:d+1], self.ApprPostMean, \
-                    StepSize*CholApprPostCov*np.sqrt((df-2.)/df), df=df)  
+                # Perturb step size during adaptation, freeze it afterwards
+                if n < AdaptIter:
+                    StepSize = np.exp(LogStepSize + (1-2*(n%2))*AdaptPerturb)
+                elif n == AdaptIter and AdaptIter > 0:
+                    StepSize = np.exp(np.mean(LogStepSizes[int(len(LogStepSizes)/2):]))
+                    self.StepSize = StepSize
+                    print ('Adapted step size = ', StepSize)
             
-            # Add current state xI to proposals    
-            Proposals = np.insert(y, 0, xI, axis=0)
+                # Sample new proposed States according to multivariate t-distribution    
+                y = multivariate_t_rvs_custom_seed(U[:,:d+1], self.ApprPostMean, \
+                        StepSize*CholApprPostCov*np.sqrt((df-2.)/df), df=df)  
+            
+                # Add current state xI to proposals    
+                Proposals = Workspace.setProposals(y, xI)
              
 
-            ########################################################
-            # Compute probability ratios = weights of IS-estimator #
-            ########################################################
+                ########################################################
+                # Compute probability ratios = weights of IS-estimator #
+                ########################################################
+
+                # Compute Log of transition probabilities
+                LogK_ni = multivariate_t_LogPdf(Proposals, self.ApprPostMean, \
+                                StepSize**2*self.ApprPostCov*(df-2.)/df, df=df)
+                LogKs   = np.sum(LogK_ni) - LogK_ni # from any state to all others
 
-            # Compute Log-posterior probabilities    
-            LogPriors       = -0.5*np.dot(np.dot(Proposals, np.identity(d)/alpha), \
-                                          (Proposals).T).diagonal(0)
-            fs              = np.dot(XX, Proposals.T)
-            LogLikelihoods  = np.dot(t,fs) - np.sum(np.log(1.+np.exp(fs)), axis=0)
-            LogPosteriors   = LogPriors + LogLikelihoods       
+                # Compute Log-posterior probabilities of new proposals, that of
+                # the current state is carried over from the previous iteration
+                LogPosteriors   = Workspace.array('LogPosteriors', N+1)
+                if First == 1:
+                    LogPosteriors[0] = LogPosterior_xI
+                LogPriors       = Workspace.quadraticForms(Proposals[First:], PriorPrec, \
+                                                           'LogPriors')
+                LogPriors      *= -0.5
+                if ScreenTol is None:
+                    np.add(LogPriors, LogLikelihood(Proposals[First:]), \
+                           out=LogPosteriors[First:])
+                    LogWeights      = LogPosteriors
+                    self.NumOfEvaluations += N+1-First
+                else:
+                    # Screen proposals by normalised weights of Gaussian surrogate
+                    # (Russian roulette); the state of largest surrogate weight is
+                    # always kept
+                    Residuals       = Proposals - InitMean
+                    LogQstates      = -0.5*np.sum(np.dot(Residuals, SurrogatePrec)*Residuals, \
+                                                  axis=1) + LogKs
+                    Qstates         = np.exp(LogQstates - np.max(LogQstates))
+                    KeepProbs       = np.minimum(1., Qstates/np.sum(Qstates)/ScreenTol)
+                    KeepProbs[np.argmax(Qstates)] = 1.
+                    Keep            = np.random.uniform(0,1,N+1) < KeepProbs
+                    New             = np.flatnonzero(Keep[First:])
+                    LogPosteriors[First+New] = LogPriors[New] \
+                                                + LogLikelihood(Proposals[First+New])
+                    LogWeights      = np.full(N+1, -np.inf)
+                    LogWeights[Keep] = LogPosteriors[Keep] - np.log(KeepProbs[Keep])
+                    self.NumOfEvaluations += len(New)
                         
             
-            # Compute Log of transition probabilities
-            LogK_ni = multivariate_t_LogPdf(Proposals, self.ApprPostMean, \
-                            StepSize**2*self.ApprPostCov*(df-2.)/df, df=df)
-            LogKs   = np.sum(LogK_ni) - LogK_ni # from any state to all others
-            
-            # Compute weights
-            LogPstates          = LogPosteriors + LogKs
-            Sorted_LogPstates   = np.sort(LogPstates)
-            LogPstates          = LogPstates - (Sorted_LogPstates[-1] + np.log(1 + \
-                                np.sum(np.exp(Sorted_LogPstates[:-1] - \
-                                              Sorted_LogPstates[-1]))))
-            Pstates             = np.exp(LogPstates)         
+                # Normalise weights and sample N-1 new states
+                LogPstates, Pstates, Is, ESS = Workspace.normaliseAndResample( \
+                                                    LogWeights, LogKs, U[:N-1,d+1])
+
+                # Store or accumulate ESS of IS-weights
+                if History:
+                    self.WeightESS[n] = ESS
+                elif n >= Start:
+                    self.WeightESSSum += ESS
+                    self.NumOfWeightESS += 1
+
+                # Archive proposals and normalised log IS-weights
+                if ArchiveDir is not None:
+                    Archive.append(Proposals, LogPstates)
             
 
-            ########################
-            # Compute IS-estimates #
-            ########################       
+                ########################
+                # Compute IS-estimates #
+                ########################       
             
-            # Compute weighted sum as posterior mean estimate
-            WeightedStates = np.tile(Pstates, (d,1)) * Proposals.T
-            self.WeightedSum[n+M,:] = np.sum(WeightedStates, axis=1).copy()
+                # Compute weighted sum as posterior mean estimate
+                WeightedSum = Workspace.weightedSum(Pstates)
             
-            # Update Approximate Posterior Mean
-            self.ApprPostMean = np.mean(self.WeightedSum[:n+M+1,:], axis=0) 
-
-            # Compute weighted sum as posterior covariance estimate
-            B1 = (Proposals - self.ApprPostMean).reshape(N+1,d,1) 
-            B2 = np.transpose(B1,(0,2,1)) 
-            A = np.matmul(B1, B2)
-            self.WeightedCov[n+M,:,:] = np.sum((np.tile(Pstates, (d,d,1)) * A.T).T, axis=0)
+                # Update Approximate Posterior Mean
+                self.SumWeightedSum = self.SumWeightedSum + WeightedSum
+                self.ApprPostMean = self.SumWeightedSum/(n+M+1)
+
+                # Compute weighted sum as posterior covariance estimate
+                WeightedCov = Workspace.weightedCov(Pstates, self.ApprPostMean)
+                self.SumWeightedCov = self.SumWeightedCov + WeightedCov
             
-            # Update Approximate Posterior Covariance
-            if n> 2*d/N: # makes sure NumOfSamples > d for covariance estimate
-                self.ApprPostCov = np.mean(self.WeightedCov[:n+M+1,:,:], axis=0)
-                CholApprPostCov = np.linalg.cholesky(self.ApprPostCov)
+                # Update Approximate Posterior Covariance
+                if n> 2*d/N: # makes sure NumOfSamples > d for covariance estimate
+                    self.ApprPostCov = self.SumWeightedCov/(n+M+1)
+                    CholApprPostCov = np.linalg.cholesky(self.ApprPostCov)
 
-            ##################################
-            # Sample according to IS-weights #
-            ##################################
+                # Store or accumulate IS-estimates
+                if History:
+                    self.WeightedSum[n,:] = WeightedSum
+                    self.WeightedCov[n,:,:] = WeightedCov
+                elif n >= Start:
+                    self.Estimates.add(WeightedSum)
+                    self.CovSum += WeightedCov
+
+                # Accumulate weighted sums of functionals after Burn-In
+                if Funs is not None and (History or n >= Start):
+                    self.FunSums.add(Proposals, Pstates)
+
+                # Accumulate marginal histograms and quantiles after Burn-In
+                if NumOfBins is not None and n >= int(BurnIn/N):
+                    self.Histogram.add(Proposals, Pstates)
+                    self.Digest.add(Proposals, Pstates)
+
+                ##################################
+                # Sample according to IS-weights #
+                ##################################
     
-            # Sample N new states 
-            PstatesSum = np.cumsum(Pstates)
-            Is = np.searchsorted(PstatesSum, U[:N-1,d+1:].flatten())
-            PstatesSubSamSum = np.cumsum(np.bincount(Is)/(N-1))
-            I = np.searchsorted(PstatesSubSamSum, U[N-1,d+1:])
+                # Select new current state among the N-1 sampled states
+                I = Workspace.selectState(Is, U[N-1,d+1])
             
-            # Add new samples to list
-            xValsNew = Proposals[Is]
-            self.xVals.append(xValsNew.copy())
-    
-            # Compute approximate acceptance rate
-            AcceptValsNew = 1. - Pstates[Is]
-            self.AcceptVals.append(AcceptValsNew)
+                # Compute approximate acceptance rate
+                AcceptValsNew = 1. - Pstates[Is]
+
+                # Add new samples and acceptance values to buffer
+                if History:
+                    self.Buffer.append(Proposals, Is, AcceptValsNew)
+                else:
+                    Kept = AcceptValsNew[max(BurnIn-n*(N-1), 0):]
+                    self.AcceptSum += np.sum(Kept)
+                    self.NumOfAccepts += len(Kept)
     
-            # Update current state
-#            I = Is[-1]
-            xI = Proposals[I,:]
+                # Update current state
+    #            I = Is[-1]
+                xI = Proposals[I,:]
+                LogPosterior_xI = LogPosteriors[I]
+
+                # Update log step size from signal difference of +/- perturbation
+                if n < AdaptIter:
+                    if AdaptSignal == 'accept':
+                        Signal = np.mean(AcceptValsNew)
+                    else:
+                        Signal = ESS/(N+1)
+                    if n%2 == 0:
+                        SignalPlus = Signal
+                    else:
+                        LogStepSize += AdaptGain/(int(n/2)+1)**0.6 * \
+                                        (SignalPlus - Signal)/(2*AdaptPerturb)
+                        LogStepSize = np.clip(LogStepSize, LogStepSizeMin, LogStepSizeMax)
+                        LogStepSizes.append(LogStepSize)
+
+            # Write memmapped samples and remaining archive to disk
+            if History:
+                self.Buffer.flush()
+            if ArchiveDir is not None:
+                Archive.flush()
+
+        finally:
+            if NumOfWorkers != 1:
+                LogLikelihood.close()
 
+        if ScreenTol is not None:
+            print ('Fraction of proposals evaluated = ', \
+                   self.NumOfEvaluations/float(NumOfIter*(N+1)))
+
+    
+    def getStepSize(self):
+        
+        """
+        Step size used after adaptation (or the fixed input StepSize)
+        
+        Outputs:
+        -------
+        StepSize    - float
+                    step size for proposed jump in mean
+        """
+        
+        return self.StepSize
+    
     
     def getSamples(self, BurnIn=0):
         
@@ -214,9 +516,38 @@ class BayesianLogReg:
                 (Number of samples) x d-dimensional array of Samples    
         """
         
-        Samples = np.concatenate(self.xVals[1:], axis=0)[BurnIn:,:]
+        if not self.History:
+            raise ValueError('Samples are only stored if History=True')
+        
+        Samples = self.Buffer.getSamples(BurnIn)
                 
         return Samples
+
+
+    def getSampleCounts(self, BurnIn=0):
+        
+        """
+        Distinct stored states and their numbers of occurrences among the
+        samples after Burn-In, e.g. for weighted statistics without
+        expanding samples
+        
+        Inputs:
+        ------
+        BurnIn  - int 
+                Burn-In period
+        
+        Outputs:
+        -------
+        States  - array_like
+                (Number of states) x d-dimensional array of states
+        Counts  - array_like
+                (Number of states)-dimensional array of counts
+        """
+        
+        if not self.History:
+            raise ValueError('Samples are only stored if History=True')
+        
+        return self.Buffer.getCounts(BurnIn)
        
         
     def getAcceptRate(self, BurnIn=0):
@@ -235,12 +566,43 @@ class BayesianLogReg:
                     average acceptance rate of MP-QMCMC 
         """    
         
-        AcceptVals = np.concatenate(self.AcceptVals)[BurnIn:]
-        AcceptRate = np.mean(AcceptVals)
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.AcceptSum/self.NumOfAccepts
+        
+        AcceptRate = self.Buffer.getAcceptRate(BurnIn)
         
         return AcceptRate
 
      
+    def getIS_WeightESS(self, N, BurnIn=0):
+        
+        """
+        Compute average effective sample size 1/sum(w^2) of the normalised
+        IS-weights w of an iteration, between 1 and the number of states
+        
+        Inputs:
+        ------
+        N           - int
+                    number of proposals per iteration
+        BurnIn      - int
+                    Burn-In period
+        
+        Outputs:
+        -------
+        WeightESS   - float
+                    average ESS of IS-weights per iteration
+        """
+        
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.WeightESSSum/self.NumOfWeightESS
+        
+        WeightESS = np.mean(self.WeightESS[int(BurnIn/N):])
+        
+        return WeightESS
+
+
     def getIS_MeanEstimate(self, N, BurnIn=0):
         
         """
@@ -253,11 +615,114 @@ class BayesianLogReg:
                         d-dimensional array
         """            
         
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.Estimates.getMean()
+        
         WeightedMean = np.mean(self.WeightedSum[int(BurnIn/N):,:], axis=0)
         
         return WeightedMean
 
 
+    def getIS_ArchiveEstimate(self, Fun, BurnIn=0):
+        
+        """
+        Compute importance sampling estimate of the posterior expectation of
+        an arbitrary function from the archive of proposals and log
+        IS-weights, without evaluating the posterior
+        
+        Inputs:
+        ------
+        Fun         - callable
+                    vectorised function mapping an (Number of states) x d-
+                    dimensional array to (Number of states) or
+                    (Number of states) x k values
+        BurnIn      - int 
+                    Burn-In period
+        
+        Outputs:
+        -------
+        Estimate    - array_like
+                    IS-estimate, of the shape of one value of Fun
+        """            
+        
+        if self.ArchiveDir is None:
+            raise ValueError('Proposals are only archived if ArchiveDir is given')
+        
+        return ArchiveEstimate(self.ArchiveDir, Fun, BurnIn)
+
+
+    def getIS_MeanVarEstimate(self, N, BurnIn=0, Method='batch', BatchSize=None):
+        
+        """
+        Estimate the Monte Carlo variance of the importance sampling mean
+        estimate from this single run by batch means over WeightedSum
+        
+        Inputs:
+        ------
+        N           - int
+                    number of proposals per iteration
+        BurnIn      - int 
+                    Burn-In period
+        Method      - string
+                    either 'batch' (batch means with batch size BatchSize)
+                    or 'cud' (dyadic batch means with fitted rate, suited
+                    for CUD driven runs)
+        BatchSize   - int
+                    iterations per batch for Method='batch'; if None,
+                    floor(sqrt(Number of iterations)) is used
+        
+        Outputs:
+        -------
+        Variance    - array_like
+                    d-dimensional array of variance estimates
+        """            
+        
+        # Without History, online dyadic batch means after the Burn-In of
+        # the run are used
+        if not self.History:
+            return self.Estimates.getVariance(Method, BatchSize)
+        
+        WeightedSum = self.WeightedSum[int(BurnIn/N):,:]
+        
+        if Method == 'batch':
+            Variance = BatchMeansVariance(WeightedSum, BatchSize)
+        elif Method == 'cud':
+            Variance = CudBatchMeansVariance(WeightedSum)[0]
+        else:
+            raise ValueError('Method must be chosen either as "batch" or as "cud"')
+        
+        return Variance
+
+
+    def getIS_FunMeanEstimate(self, N, BurnIn=0):
+        
+        """
+        Compute importance sampling estimates of the functionals Funs
+
+        Inputs:
+        -------   
+        N               - int 
+                        number of proposals per iteration      
+        BurnIn          - int
+                        Burn-In period  
+                
+        Outputs:
+        -------
+        WeightedMeans   - list
+                        IS-estimates, each of the shape of one value of
+                        its functional
+        """            
+        
+        if self.FunSums is None:
+            raise ValueError('Functionals are only estimated if Funs is given')
+        
+        # Without History, the Burn-In of the run applies
+        WeightedMeans = self.FunSums.getMean(int(BurnIn/N))
+        
+        return WeightedMeans
+
+
     def getIS_CovEstimate(self, N, BurnIn=0):
         
         """
@@ -269,6 +734,10 @@ class BayesianLogReg:
         WeightedCov - d-dimensional array
         """            
         
+        # Without History, the Burn-In of the run applies
+        if not self.History:
+            return self.CovSum/self.Estimates.getNumOfSums()
+        
         WeightedCov = np.mean(self.WeightedCov[int(BurnIn/N):,:,:], axis=0)
         
         return WeightedCov
@@ -290,32 +759,103 @@ class BayesianLogReg:
                 (Number of samples) x d-dimensional array of Samples     
         """
         
+        if not self.History:
+            raise ValueError('Weighted sums are only stored if History=True')
+        
         WeightedSum = self.WeightedSum[int(BurnIn/N):,:]
                 
         return WeightedSum
     
       
-    def getMarginalHistogram(self, Index=0, BarNum=100, BurnIn=0):
+    def getMarginalDensity(self):
+        
+        """
+        IS-weighted marginal densities of all coordinates, accumulated
+        during the run after Burn-In
+        
+        Outputs:
+        -------
+        Edges   - array_like
+                d x (NumOfBins+1)-dimensional array of bin edges
+        Density - array_like
+                d x NumOfBins-dimensional array of densities
+        """
+        
+        if self.Histogram is None:
+            raise ValueError('Marginals are only accumulated if NumOfBins is given')
         
+        return self.Histogram.getDensity()
+
+
+    def getMarginalQuantiles(self, Probs):
+        
+        """
+        IS-weighted marginal quantiles of all coordinates, accumulated
+        during the run after Burn-In
+        
+        Inputs:
+        ------
+        Probs       - array_like
+                    probabilities in [0,1]
+        
+        Outputs:
+        -------
+        Quantiles   - array_like
+                    (Number of probabilities) x d-dimensional array
         """
-        Plot histogram of marginal distribution for posterior samples using 
-        MP-QMCMC
+        
+        if self.Histogram is None:
+            raise ValueError('Marginals are only accumulated if NumOfBins is given')
+        
+        return self.Digest.getQuantiles(Probs)
+
+
+    def getMarginalHistogram(self, Index=0, BarNum=None, BurnIn=None):
+        
+        """
+        Plot histogram of the marginal distribution of one coordinate. With
+        History, it is formed from the stored samples of MP-QMCMC; without
+        History, the IS-weighted histogram accumulated during the run is
+        plotted, which is fixed to the NumOfBins and Burn-In of the run,
+        see getMarginalDensity
         
         Inputs:
         ------
-        Index   - int 
+        Index   - int
                 index of dimension for marginal distribution
+        BarNum  - int
+                number of bins; if None, 100 with History and NumOfBins
+                of the run otherwise
         BurnIn  - int
-                Burn-In period
+                Burn-In period; if None, 0 with History and Burn-In of the
+                run otherwise
         
         Outputs:
         -------
         Plot
         """         
 
+        # Without History, only the IS-weighted histogram accumulated after
+        # the Burn-In of the run is available
+        if not self.History:
+            if self.Histogram is None:
+                raise ValueError('Without History, marginals are only available if NumOfBins is given')
+            if BarNum not in (None, self.NumOfBins) or BurnIn not in (None, self.BurnIn):
+                raise ValueError('Without History, the marginal histogram is fixed to ' \
+                                 'NumOfBins={} and BurnIn={} of the run'.format( \
+                                 self.NumOfBins, self.BurnIn))
+            Edges, Density = self.Histogram.getDensity()
+            return PlotMarginalDensity(Edges[Index], Density[Index])
+
+        if BarNum is None:
+            BarNum = 100
+        if BurnIn is None:
+            BurnIn = 0
+        States, Counts = self.getSampleCounts(BurnIn)
         Fig = plt.figure()
         SubPlot = Fig.add_subplot(111)
-        SubPlot.hist(self.getSamples(BurnIn)[:,Index], BarNum, label = "PDF Histogram", density = True)
+        SubPlot.hist(States[:,Index], BarNum, weights = Counts, label = "PDF Histogram", \
+                     density = True)
         
         return Fig
 
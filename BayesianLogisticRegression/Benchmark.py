@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to benchmark computational kernels of the logistic Bayesian
+regression sampler on the bundled data sets and on a large synthetic data
+set. Each kernel is compared against the straightforward implementation it
+replaces, both in run time and in result, and the per-iteration kernels
+also in the temporary memory allocated by one call.
+"""
+
+import time
+import tracemalloc
+import numpy as np
+from Data import DataLoad, Cases
+from Likelihood import LogisticLikelihood
+from Workspace import IterationWorkspace
+
+
+def TimeIt(Fun, *Args, Repeats=10):
+
+    """
+    Measures the minimal wall time of Repeats calls of Fun(*Args)
+
+    Inputs:
+    ------
+    Fun         - callable
+                function to be timed
+    Args        - tuple
+                arguments passed to Fun
+    Repeats     - int
+                number of timed calls
+
+    Outputs:
+    -------
+    Time        - float
+                minimal time of a single call in seconds
+    Result      - any
+                return value of the last call
+    """
+
+    Times = np.zeros(Repeats)
+    for r in range(Repeats):
+        StartTime = time.perf_counter()
+        Result = Fun(*Args)
+        Times[r] = time.perf_counter() - StartTime
+
+    return np.min(Times), Result
+
+
+def SyntheticData(m, d, Seed=0):
+
+    """
+    Generates a synthetic logistic regression data set with standard normal
+    covariates and intercept
+
+    Inputs:
+    ------
+    m           - int
+                number of observations
+    d           - int
+                dimension including intercept
+    Seed        - int
+                seed of random number generator
+
+    Outputs:
+    -------
+    XX          - array_like
+                m x d-dimensional design matrix
+    t           - array_like
+                responses in {0,1}
+    """
+
+    Rng = np.random.RandomState(Seed)
+    XX = Rng.standard_normal((m,d))
+    XX[:,0] = 1.
+    Beta = Rng.standard_normal(d)/np.sqrt(d)
+    t = (Rng.uniform(0,1,m) < 1./(1.+np.exp(-XX.dot(Beta)))).astype(float)
+
+    return XX, t
+
+
+def ReferenceLogLikelihood(XX, t, Proposals):
+
+    """
+    Log-likelihood as evaluated originally by BayesianLogReg, with the
+    m x (N+1) temporaries of all rows at once and without protection
+    against overflow
+    """
+
+    fs = np.dot(XX, Proposals.T)
+    return np.dot(t, fs) - np.sum(np.log(1.+np.exp(fs)), axis=0)
+
+
+def LikelihoodBenchmark(Name, XX, t, N, MaxMemory=2**22, Repeats=10):
+
+    """
+    Compares the likelihood kernel, without and with row chunks of
+    MaxMemory bytes, with the reference implementation for N+1 random
+    states and prints timings and the maximal relative deviation
+    """
+
+    d = XX.shape[1]
+    Proposals = np.random.RandomState(1).standard_normal((N+1,d))/np.sqrt(d)
+
+    RefTime, RefResult = TimeIt(ReferenceLogLikelihood, XX, t, Proposals, Repeats=Repeats)
+    Time, Result = TimeIt(LogisticLikelihood(XX, t), Proposals, Repeats=Repeats)
+    ChunkTime = TimeIt(LogisticLikelihood(XX, t, MaxMemory), Proposals, Repeats=Repeats)[0]
+    print ("{:>12} m={:>8} d={:>4}: reference {:.3e}s, kernel {:.3e}s, kernel with "\
+           "row chunks {:.3e}s, max rel. deviation {:.1e}".format(Name, XX.shape[0], d, \
+           RefTime, Time, ChunkTime, np.max(np.abs(Result-RefResult)/np.abs(RefResult))))
+
+
+def TemporaryMemory(Fun, *Args):
+
+    """
+    Measures the peak memory in bytes allocated by one call of Fun(*Args),
+    as traced by tracemalloc (which includes numpy array data); it stands
+    in for the number of allocations per call, which numpy does not expose
+    """
+
+    tracemalloc.start()
+    Start = tracemalloc.get_traced_memory()[0]
+    Fun(*Args)
+    Peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return Peak - Start
+
+
+def ReferenceIteration(y, xI, Pstates, Mean, PriorPrec):
+
+    """
+    Log-priors and IS-estimates of one iteration as
+    computed originally by BayesianLogReg, allocating new arrays in every
+    step (including the (N+1)x(N+1) array of the quadratic form and the
+    (N+1)xdxd array of outer products)
+    """
+
+    Proposals = np.insert(y, 0, xI, axis=0)
+    [NumOfStates,d] = Proposals.shape
+    LogPriors = -0.5*np.dot(np.dot(Proposals, PriorPrec), (Proposals).T).diagonal(0)
+    WeightedStates = np.tile(Pstates, (d,1)) * Proposals.T
+    WeightedSum = np.sum(WeightedStates, axis=1)
+    B1 = (Proposals - Mean).reshape(NumOfStates,d,1)
+    B2 = np.transpose(B1,(0,2,1))
+    A = np.matmul(B1, B2)
+    WeightedCov = np.sum((np.tile(Pstates, (d,d,1)) * A.T).T, axis=0)
+
+    return LogPriors, WeightedSum, WeightedCov
+
+
+def WorkspaceIteration(Workspace, y, xI, Pstates, Mean, PriorPrec):
+
+    """
+    Same quantities as ReferenceIteration, written into the preallocated
+    arrays of an IterationWorkspace, with the covariance estimate formed as
+    a weighted Gram matrix
+    """
+
+    Proposals = Workspace.setProposals(y, xI)
+    LogPriors = Workspace.quadraticForms(Proposals, PriorPrec, 'LogPriors')
+    LogPriors *= -0.5
+    WeightedSum = Workspace.weightedSum(Pstates)
+    WeightedCov = Workspace.weightedCov(Pstates, Mean)
+
+    return LogPriors, WeightedSum, WeightedCov
+
+
+def IterationBenchmark(N, d, alpha=100., Repeats=1000):
+
+    """
+    Compares the iteration kernels using an IterationWorkspace with the
+    reference implementation for N+1 random states of dimension d and
+    prints the time and temporary memory of one iteration and the maximal
+    deviation of results
+    """
+
+    Rng = np.random.RandomState(1)
+    y = Rng.standard_normal((N,d))
+    xI = Rng.standard_normal(d)
+    Pstates = Rng.uniform(0,1,N+1)
+    Pstates /= np.sum(Pstates)
+    Mean = np.dot(Pstates[1:], y)
+    PriorPrec = np.identity(d)/alpha
+    Workspace = IterationWorkspace(N, d)
+    Args = (y, xI, Pstates, Mean, PriorPrec)
+
+    RefTime, RefResults = TimeIt(ReferenceIteration, *Args, Repeats=Repeats)
+    Time, Results = TimeIt(WorkspaceIteration, Workspace, *Args, Repeats=Repeats)
+    RefMemory = TemporaryMemory(ReferenceIteration, *Args)
+    Memory = TemporaryMemory(WorkspaceIteration, Workspace, *Args)
+    Deviation = max([np.max(np.abs(Result-RefResult)) for Result, RefResult in \
+                     zip(Results, RefResults)])
+    print ("N={:>4} d={:>4}: reference {:.3e}s and {:>8} bytes peak, workspace {:.3e}s "\
+           "and {:>8} bytes peak per iteration, max deviation {:.1e}".format(N, d, \
+           RefTime, RefMemory, Time, Memory, Deviation))
+
+
+def ReferenceResampling(LogPosteriors, LogKs, U, u):
+
+    """
+    Normalisation of IS-weights and resampling of N-1 states and of the
+    new current state as implemented originally by BayesianLogReg, with a
+    full sort of the log-weights
+    """
+
+    LogPstates = LogPosteriors + LogKs
+    Sorted_LogPstates = np.sort(LogPstates)
+    LogPstates = LogPstates - (Sorted_LogPstates[-1] + np.log(1 + \
+                    np.sum(np.exp(Sorted_LogPstates[:-1] - Sorted_LogPstates[-1]))))
+    Pstates = np.exp(LogPstates)
+    PstatesSum = np.cumsum(Pstates)
+    Is = np.searchsorted(PstatesSum, U)
+    PstatesSubSamSum = np.cumsum(np.bincount(Is)/len(Is))
+    I = np.searchsorted(PstatesSubSamSum, u)
+
+    return Pstates, Is, I
+
+
+def FusedResampling(Workspace, LogPosteriors, LogKs, U, u):
+
+    """
+    Same quantities as ReferenceResampling by the fused kernel of an
+    IterationWorkspace
+    """
+
+    LogPstates, Pstates, Is, ESS = Workspace.normaliseAndResample(LogPosteriors, LogKs, U)
+    I = Workspace.selectState(Is, u)
+
+    return Pstates, Is, I
+
+
+def ResamplingBenchmark(N, Repeats=1000):
+
+    """
+    Compares the fused normalisation and resampling kernel with the
+    reference implementation for N+1 random log-weights and prints the
+    time and temporary memory of one iteration, the maximal deviation of
+    weights and the number of differently sampled states
+    """
+
+    Rng = np.random.RandomState(1)
+    LogPosteriors = 10.*Rng.standard_normal(N+1) - 500.
+    LogKs = Rng.standard_normal(N+1)
+    U = Rng.uniform(0,1,N-1)
+    u = Rng.uniform()
+    Workspace = IterationWorkspace(N, 1)
+    Args = (LogPosteriors, LogKs, U, u)
+
+    RefTime, RefResults = TimeIt(ReferenceResampling, *Args, Repeats=Repeats)
+    Time, Results = TimeIt(FusedResampling, Workspace, *Args, Repeats=Repeats)
+    RefMemory = TemporaryMemory(ReferenceResampling, *Args)
+    Memory = TemporaryMemory(FusedResampling, Workspace, *Args)
+    print ("N={:>5}: reference {:.3e}s and {:>7} bytes peak, fused {:.3e}s and {:>7} bytes peak "\
+           "per iteration, max deviation {:.1e}, {} states sampled differently".format(N, \
+           RefTime, RefMemory, Time, Memory, np.max(np.abs(Results[0]-RefResults[0])), \
+           np.sum(Results[1] != RefResults[1]) + int(Results[2] != RefResults[2])))
+
+
+if __name__ == '__main__':
+
+    #############################
+    # Parameters for benchmarks #
+    #############################
+
+    N           = 32             # Number of proposed states
+    m           = 10**6          # Number of observations of synthetic data
+    d           = 25             # Dimension of synthetic data
+
+
+    ##########################
+    # Likelihood evaluations #
+    ##########################
+
+    print ("Log-likelihood of N+1={} states:".format(N+1))
+    for Case in Cases:
+        Data = DataLoad(Case)
+        LikelihoodBenchmark(Case, Data.getDesignMatrix(), Data.getResponses(), N)
+
+    XX, t = SyntheticData(m, d)
+    LikelihoodBenchmark('synthetic', XX, t, N, Repeats=3)
+
+
+    #####################
+    # Iteration kernels #
+    #####################
+
+    print ("Temporary memory is reported as the tracemalloc peak in bytes per "\
+           "iteration instead of allocation counts, which numpy does not expose.")
+    print ("IS-estimates of one iteration:")
+    for NumOfProposals in [4, 16, 64, 1024]:
+        for Dimension in [3, 8, d]:
+            IterationBenchmark(NumOfProposals, Dimension)
+
+    print ("Normalisation of IS-weights and resampling:")
+    for NumOfProposals in [4, 16, 64, 1024, 2**14]:
+        ResamplingBenchmark(NumOfProposals)
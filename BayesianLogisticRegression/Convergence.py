@@ -17,10 +17,10 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 import time
-from scipy.optimize import root
 from scipy.stats import linregress
 from BayesianLogisticRegression import BayesianLogReg
 from Data import DataLoad
+from Laplace import LaplaceApprox
 
 
 if __name__ == '__main__':
@@ -101,32 +101,17 @@ if __name__ == '__main__':
     
         Data        = DataLoad(Case)
         d           = Data.getDimension()
-        XX          = Data.getDesignMatrix()
-        t           = Data.getResponses()
-        m           = Data.getNumOfSamples()
         
         
         ######################################################
         # Compute initial mean and covariance for BurnIn-run #
         ######################################################
             
-        # Compute initial estimate of posterior mean via root of posterior derivative
-        def PostDer(z):
-            f = np.dot(XX,z)
-            PostDer = np.dot(XX.T, t - (np.exp(f)/(1+np.exp(f)))) \
-                        - 1./alpha*np.dot(np.identity(d),z)   
-            return PostDer 
-    
-        RootRes = root(PostDer, np.zeros(d), tol=1e-15)
-        InitMean = RootRes.x    
-        
-        # Calculate initial estimate of posterior covariance via FisherInfo
-        f = np.dot(XX,InitMean)
-        p = 1./(1+np.exp(-f))
-        v = p*(np.ones(m)-p)
-        v1 = np.multiply(v,XX.T)
-        Ginit = np.dot(v1,XX) + np.identity(d)/alpha   
-        InitCov = np.linalg.inv(Ginit)
+        # Laplace approximation: posterior mode by Newton iterations and
+        # inverse Fisher information at the mode
+        Laplace     = LaplaceApprox(Data, alpha)
+        InitMean    = Laplace.getMean()
+        InitCov     = Laplace.getCov()
     
 
         ##############################################
@@ -166,6 +151,10 @@ if __name__ == '__main__':
         # Arrays to be filled with IS posterior estimates
         QMC_EstimArray = np.zeros((len(N_Array), NumOfSim, d))
         PSR_EstimArray = np.zeros((len(N_Array), NumOfSim, d))
+        
+        # Arrays to be filled with single-run variance estimates
+        QMC_SingleRunVarArray = np.zeros((len(N_Array), NumOfSim, d))
+        PSR_SingleRunVarArray = np.zeros((len(N_Array), NumOfSim, d))
     
         for p in range(N_Array.shape[0]):
             
@@ -215,13 +204,21 @@ if __name__ == '__main__':
     
                 ################## QMC #####################
     
-                # Compute estimated IS mean
-                QMC_EstimArray[p,j,:] = QMC_BLR.getIS_MeanEstimate(N, WeightIn)
+                # Compute estimated IS mean (the initial estimates weighted
+                # in by WeightIn only enter the proposals)
+                QMC_EstimArray[p,j,:] = QMC_BLR.getIS_MeanEstimate(N)
+                
+                # Compute single-run variance estimate of IS mean
+                QMC_SingleRunVarArray[p,j,:] = QMC_BLR.getIS_MeanVarEstimate(N, \
+                                                            Method='cud')
     
                 ################## PSR #####################
     
                 # Compute estimated IS mean
-                PSR_EstimArray[p,j,:] = PSR_BLR.getIS_MeanEstimate(N, WeightIn)
+                PSR_EstimArray[p,j,:] = PSR_BLR.getIS_MeanEstimate(N)
+                
+                # Compute single-run variance estimate of IS mean
+                PSR_SingleRunVarArray[p,j,:] = PSR_BLR.getIS_MeanVarEstimate(N)
     
         
         ###############################
@@ -236,6 +233,14 @@ if __name__ == '__main__':
         QMC_EstimAverageVarTrace = np.sum(QMC_EstimAverageVar, axis=1)
         PSR_EstimAverageVarTrace = np.sum(PSR_EstimAverageVar, axis=1)
         
+        # Compare with average single-run (batch means) variance trace
+        QMC_SingleRunVarTrace = np.sum(np.mean(QMC_SingleRunVarArray, axis=1), axis=1)
+        PSR_SingleRunVarTrace = np.sum(np.mean(PSR_SingleRunVarArray, axis=1), axis=1)
+        print ("QMC variance trace (empirical, single-run) = ", \
+               QMC_EstimAverageVarTrace, QMC_SingleRunVarTrace)
+        print ("PSR variance trace (empirical, single-run) = ", \
+               PSR_EstimAverageVarTrace, PSR_SingleRunVarTrace)
+        
         
        ######################################
         # SUM OF COMPONENTS OF SQUARED BIAS #
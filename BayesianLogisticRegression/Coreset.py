@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to compress the data of a logistic Bayesian regression problem into
+a weighted coreset by sensitivity sampling. Rows are drawn with probability
+proportional to a sensitivity proxy computed from the Laplace approximation,
+namely the size of the first and second order terms of the change of their
+log-likelihood over the posterior bulk, mixed with uniform sampling, and weighted by inverse probabilities, so that
+the coreset log-likelihood is an unbiased estimate of the full one. The
+coreset has the interface of DataLoad and can be passed to BayesianLogReg.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+from Likelihood import LogisticLikelihood
+
+
+class Coreset:
+
+    def __init__(self, Data, Laplace, Size, ChunkSize=2**16):
+
+        """
+        Inputs:
+        -------
+        Data            - DataLoad
+                        data of the logistic regression problem
+        Laplace         - LaplaceApprox
+                        Laplace approximation of the posterior
+        Size            - int
+                        number of rows drawn (with replacement); the coreset
+                        consists of the distinct rows drawn
+        ChunkSize       - int
+                        number of rows processed at once
+        """
+
+        XX = Data.getDesignMatrix()
+        t = Data.getResponses()
+        Weights = Data.getWeights()
+        m = XX.shape[0]
+        Mean = Laplace.getMean()
+        Cov = Laplace.getCov()
+
+        # Sensitivity proxies |t-p|*sd + p*(1-p)*var/2 of the linear predictor
+        # under the Laplace approximation, accumulated over row chunks
+        Sensitivities = np.zeros(m)
+        for i in range(0, m, ChunkSize):
+            X = XX[i:i+ChunkSize]
+            XCov = X.dot(Cov)
+            if sparse.issparse(X):
+                Var = np.asarray(X.multiply(XCov).sum(axis=1)).ravel()
+            else:
+                Var = np.sum(X*XCov, axis=1)
+            p = expit(X.dot(Mean))
+            Sensitivities[i:i+ChunkSize] = np.abs(t[i:i+ChunkSize]-p)*np.sqrt(Var) \
+                                            + 0.5*p*(1.-p)*Var
+        Multiplicities = np.ones(m) if Weights is None else Weights
+
+        # Sampling probabilities mixed with uniform sampling for robustness
+        Probs = 0.5*Multiplicities*Sensitivities/np.dot(Multiplicities, Sensitivities) \
+                + 0.5*Multiplicities/np.sum(Multiplicities)
+
+        # Draw rows and weight distinct rows by inverse probabilities
+        Draws = np.searchsorted(np.cumsum(Probs), np.random.uniform(0,1,Size))
+        Indices, Counts = np.unique(np.minimum(Draws, m-1), return_counts=True)
+
+        self.XX = XX[Indices]
+        self.t = np.array(t[Indices])
+        self.Weights = Counts*Multiplicities[Indices]/(Size*Probs[Indices])
+        self.case = '{}_coreset{}'.format(Data.getCase(), Size)
+        self.PolynomialOrder = Data.getPolynomialOrder()
+        [self.m,self.d] = self.XX.shape
+
+        self.Data = Data
+        self.Laplace = Laplace
+        self.ChunkSize = ChunkSize
+
+
+    def getDiagnostic(self, NumOfStates=100, MaxMemory=None):
+
+        """
+        Estimates the approximation error of the coreset log-likelihood over
+        the posterior bulk: for states drawn from the Laplace approximation,
+        the log-likelihood differences to the posterior mode are compared
+        with those of the full data, which bounds the error of the
+        unnormalised log-posterior ratios entering the IS-weights. Costs one
+        evaluation of the full likelihood for NumOfStates+1 states, over
+        row chunks of bounded memory
+
+        Inputs:
+        -------
+        NumOfStates     - int
+                        number of states drawn from the Laplace approximation
+        MaxMemory       - int
+                        bound in bytes on temporaries of the full likelihood;
+                        if None, row chunks of ChunkSize rows are used
+
+        Outputs:
+        -------
+        MaxError        - float
+                        maximal absolute error of log-likelihood differences
+        MeanError       - float
+                        mean absolute error of log-likelihood differences
+        """
+
+        Mean = self.Laplace.getMean()
+        States = np.random.multivariate_normal(Mean, self.Laplace.getCov(), NumOfStates)
+        States = np.insert(States, 0, Mean, axis=0)
+
+        if MaxMemory is None:
+            MaxMemory = 8*self.ChunkSize*(2*(NumOfStates+1) + self.d)
+        Full = LogisticLikelihood(self.Data.getDesignMatrix(), self.Data.getResponses(), \
+                                  MaxMemory, self.Data.getWeights())(States)
+        Approx = LogisticLikelihood(self.XX, self.t, Weights=self.Weights)(States)
+        Errors = np.abs((Approx[1:] - Approx[0]) - (Full[1:] - Full[0]))
+
+        return np.max(Errors), np.mean(Errors)
+
+    def getKey(self):
+        return None
+
+    def getCase(self):
+        return self.case
+
+    def getPolynomialOrder(self):
+        return self.PolynomialOrder
+
+    def getDimension(self):
+        return self.d
+
+    def getDesignMatrix(self):
+        return self.XX
+
+    def getNumOfSamples(self):
+        return self.m
+
+    def getResponses(self):
+        return self.t
+
+    def getWeights(self):
+        return self.Weights
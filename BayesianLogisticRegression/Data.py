@@ -8,157 +8,329 @@ Created on Tue Oct  2 18:58:44 2018
 Script to load data for logistic Bayesian regression problems.
 """
 
+import os
+import hashlib
 import numpy as np
+from scipy import sparse
+
+
+# Data directory next to this script, independent of the working directory
+DataDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data')
+
+# Bundled data sets; responses of 'german' and 'heart' are coded as 1/2
+Cases = ['ripley', 'pima', 'heart', 'australian', 'german']
+RecodedCases = ['german', 'heart']
+
 
 class DataLoad:
 
-    def __init__(self, case):
+    def __init__(self, case, PolynomialOrder=1, Standardise=True, \
+                 MemoryMap=False, CacheDir=os.path.join(DataDir, 'cache'), \
+                 Deduplicate=False):
 
         """
         Inputs:
-        -------   
+        -------
         Case            - string
-                        determines the data used
-        """                
-        
-        if case == 'ripley':        
-    
-            # Two hyperparameters of model
-            Polynomial_Order = 1;
-    
-            # Load and prepare Train and Test Data
-            X = np.loadtxt('./Data/ripley.txt')
-            self.t = X[:,-1]
-            X = X[:,:-1]
-            self.m = X.shape[0]
-    
-            # Standardise Data
-            X = (X - np.tile(np.mean(X, axis=0),(self.m,1))) / \
-                np.tile(np.std(X, axis=0, ddof=1),(self.m,1))
-    
-            #Create Polynomial Basis
-            self.XX = np.ones((self.m,1))
-            for i in range(Polynomial_Order+1)[1:]:
-                self.XX = np.concatenate((self.XX, X**i), axis=1)
-    
-            [self.m,self.d] = self.XX.shape
-    
-
-        elif case == 'pima':
-            
-    
-            # Two hyperparameters of model
-            Polynomial_Order = 1;
-    
-            # Load and prepare Train and Test Data
-            X = np.loadtxt('./Data/pima.txt')
-            self.t = X[:,-1]
-            X = X[:,:-1]
-            self.m = X.shape[0]
-    
-            # Standardise Data
-            X = (X - np.tile(np.mean(X, axis=0),(self.m,1))) / \
-                np.tile(np.std(X, axis=0, ddof=1),(self.m,1))
-    
-            #Create Polynomial Basis
-            self.XX = np.ones((self.m,1))
-            for i in range(Polynomial_Order+1)[1:]:
-                self.XX = np.concatenate((self.XX, X**i), axis=1)
-    
-            [self.m,self.d] = self.XX.shape
-    
-    
-        elif case == 'german':
-    
-            # Two hyperparameters of model
-            Polynomial_Order = 1;
-    
-            # Load and prepare Train and Test Data
-            X = np.loadtxt('./Data/german.txt')
-            self.t = X[:,-1]
-            X = X[:,:-1]
-            self.m = X.shape[0]
-    
-            # Replace all 1s in t with 0s
-            self.t[self.t==1] = 0
-            # Replace all 2s in t with 1s
-            self.t[self.t==2] = 1
-    
-            # Standardise Data
-            X = (X - np.tile(np.mean(X, axis=0),(self.m,1))) / \
-                np.tile(np.std(X, axis=0, ddof=1),(self.m,1))
-    
-            #Create Polynomial Basis
-            self.XX = np.ones((self.m,1))
-            for i in range(Polynomial_Order+1)[1:]:
-                self.XX = np.concatenate((self.XX, X**i), axis=1)
-    
-            [self.m,self.d] = self.XX.shape
-    
-
-        elif case == 'heart':
-    
-            # Two hyperparameters of model
-            Polynomial_Order = 1;
-    
-            # Load and prepare Train and Test Data
-            X = np.loadtxt('./Data/heart.txt')
-            self.t = X[:,-1]
-            X = X[:,:-1]
-            self.m = X.shape[0]
-    
+                        determines the data used; either one of the bundled
+                        data sets or the path to a text or .npy file with
+                        observations in rows and responses in the last
+                        column (.npy files are processed in row chunks), or
+                        to a scipy.sparse .npz file of the same layout
+        PolynomialOrder - int
+                        order of polynomial basis of design matrix
+        Standardise     - bool
+                        standardise covariates to zero mean and unit variance
+                        (sparse data are only scaled to unit variance, which
+                        preserves sparsity)
+        MemoryMap       - bool
+                        open the cached design matrix as read-only memmap
+                        instead of loading it into memory (dense data only)
+        CacheDir        - string
+                        directory of binary cache of prepared design matrix
+                        and responses, found by path, size and modification
+                        time of the source file; if None, no cache is used
+        Deduplicate     - bool
+                        collapse identical pairs of design matrix row and
+                        response into one row weighted by its multiplicity
+                        (dense data only; row order is not preserved)
+        """
+
+        if case in Cases:
+            SourceFile = os.path.join(DataDir, '{}.txt'.format(case))
+            self.case = case
+        elif os.path.isfile(case):
+            SourceFile = case
+            self.case = os.path.splitext(os.path.basename(case))[0]
+        else:
+            raise ValueError("case must be chosen from one of the following: 'ripley',\
+                             'pima', 'heart', 'australian', 'german' or be a data file")
+
+        self.PolynomialOrder = PolynomialOrder
+        self.Weights = None
+        self.SourceFile = SourceFile
+        self.Options = 'order{}_std{}'.format(PolynomialOrder, int(Standardise))
+        if Deduplicate:
+            self.Options += '_dedup'
+        self.Key = None
+
+        if Deduplicate and SourceFile.endswith('.npz'):
+            raise ValueError('Deduplication is only supported for dense data')
+
+        if CacheDir is None:
+            self.XX, self.t = self.prepare(SourceFile, PolynomialOrder, Standardise)
+            if Deduplicate:
+                self.XX, self.t, self.Weights = self.deduplicate(self.XX, self.t)
+
+        else:
+            # Cache key from source file content and preprocessing options,
+            # looked up by path, size and modification time of the source
+            # file, so that its content is only hashed when the cache is built
+            Stat = os.stat(SourceFile)
+            StatHash = hashlib.sha1('{}:{}:{}'.format(os.path.abspath(SourceFile), \
+                                    Stat.st_size, Stat.st_mtime_ns).encode()).hexdigest()[:16]
+            KeyFile = os.path.join(CacheDir, '{}_{}_{}.key'.format(self.case, StatHash, \
+                                                                  self.Options))
+            if os.path.isfile(KeyFile):
+                with open(KeyFile) as File:
+                    self.Key = File.read().strip()
+            Key = self.getKey()
+            Tmp = '.{}.tmp'.format(os.getpid())
+            IsSparse = SourceFile.endswith('.npz')
+            XXFile = os.path.join(CacheDir, Key+('_XX.npz' if IsSparse else '_XX.npy'))
+            tFile = os.path.join(CacheDir, Key+'_t.npy')
+            wFile = os.path.join(CacheDir, Key+'_w.npy')
+
+            if not (os.path.isfile(XXFile) and os.path.isfile(tFile) and \
+                    (os.path.isfile(wFile) or not Deduplicate)):
+                os.makedirs(CacheDir, exist_ok=True)
+
+                # Write to temporary files first, so that concurrent runs
+                # never load a partially written cache
+                if IsSparse:
+                    XX, t = self.prepare(SourceFile, PolynomialOrder, Standardise)
+                    with open(XXFile+Tmp, 'wb') as File:
+                        sparse.save_npz(File, XX)
+                elif Deduplicate:
+                    XX, t, w = self.deduplicate(*self.prepare(SourceFile, \
+                                                PolynomialOrder, Standardise))
+                    with open(XXFile+Tmp, 'wb') as File:
+                        np.save(File, XX)
+                    with open(wFile+Tmp, 'wb') as File:
+                        np.save(File, w)
+                    os.replace(wFile+Tmp, wFile)
+                else:
+                    XX, t = self.prepare(SourceFile, PolynomialOrder, Standardise, \
+                                         XXFile+Tmp)
+                del XX
+                with open(tFile+Tmp, 'wb') as File:
+                    np.save(File, t)
+                os.replace(XXFile+Tmp, XXFile)
+                os.replace(tFile+Tmp, tFile)
+
+            if not os.path.isfile(KeyFile):
+                with open(KeyFile+Tmp, 'w') as File:
+                    File.write(Key)
+                os.replace(KeyFile+Tmp, KeyFile)
+
+            if IsSparse:
+                self.XX = sparse.load_npz(XXFile)
+            else:
+                self.XX = np.load(XXFile, mmap_mode='r' if MemoryMap else None)
+            self.t = np.load(tFile)
+            if Deduplicate:
+                self.Weights = np.load(wFile)
+
+        [self.m,self.d] = self.XX.shape
+
+
+    def prepare(self, SourceFile, PolynomialOrder, Standardise, OutFile=None, \
+                ChunkSize=2**16):
+
+        """
+        Parses data file and creates design matrix and responses; rows are
+        processed in chunks, so that .npy data sets need not fit into memory
+
+        Inputs:
+        -------
+        SourceFile      - string
+                        path to data file
+        PolynomialOrder - int
+                        order of polynomial basis of design matrix
+        Standardise     - bool
+                        standardise covariates to zero mean and unit variance
+        OutFile         - string
+                        if given, the design matrix is written to this .npy
+                        file as memmap instead of being kept in memory
+        ChunkSize       - int
+                        number of rows processed at once
+
+        Outputs:
+        -------
+        XX              - array_like
+                        (Number of observations) x d-dimensional design matrix
+        t               - array_like
+                        responses in {0,1}
+        """
+
+        if SourceFile.endswith('.npz'):
+            return self.prepareSparse(SourceFile, PolynomialOrder, Standardise)
+
+        # Load and prepare Train and Test Data
+        if SourceFile.endswith('.npy'):
+            X = np.load(SourceFile, mmap_mode='r')
+        else:
+            X = np.loadtxt(SourceFile)
+        [m,p] = X.shape
+        p -= 1
+
+        t = np.array(X[:,-1], dtype=float)
+        if self.case in RecodedCases:
             # Replace all 1s in t with 0s
-            self.t[self.t==1] = 0
+            t[t==1] = 0
             # Replace all 2s in t with 1s
-            self.t[self.t==2] = 1
-    
-            # Standardise Data
-            X = (X - np.tile(np.mean(X, axis=0),(self.m,1))) / \
-                np.tile(np.std(X, axis=0, ddof=1),(self.m,1))
-    
-            #Create Polynomial Basis
-            self.XX = np.ones((self.m,1))
-            for i in range(Polynomial_Order+1)[1:]:
-                self.XX = np.concatenate((self.XX, X**i), axis=1)
-    
-            [self.m,self.d] = self.XX.shape
-   
-    
-        elif case == 'australian':
-    
-    
-            # Two hyperparameters of model
-            Polynomial_Order = 1;
-    
-            # Load and prepare Train and Test Data
-            X = np.loadtxt('./Data/australian.txt')
-            self.t = X[:,-1]
-            X = X[:,:-1]
-            self.m = X.shape[0]
-    
-            # Standardise Data
-            X = (X - np.tile(np.mean(X, axis=0),(self.m,1))) / \
-                np.tile(np.std(X, axis=0, ddof=1),(self.m,1))
-    
-            #Create Polynomial Basis
-            self.XX = np.ones((self.m,1))
-            for i in range(Polynomial_Order+1)[1:]:
-                self.XX = np.concatenate((self.XX, X**i), axis=1)
-    
-            [self.m,self.d] = self.XX.shape
-            
+            t[t==2] = 1
+
+        # Means and standard deviations for standardisation
+        if not Standardise:
+            Mean, Std = 0., 1.
+        elif isinstance(X, np.memmap):
+            # Sums over row chunks, shifted by first row for stability
+            Shift = np.array(X[0,:-1], dtype=float)
+            Sum, SumSq = np.zeros(p), np.zeros(p)
+            for i in range(0, m, ChunkSize):
+                Chunk = X[i:i+ChunkSize,:-1] - Shift
+                Sum += np.sum(Chunk, axis=0)
+                SumSq += np.sum(Chunk**2, axis=0)
+            Mean = Shift + Sum/m
+            Std = np.sqrt((SumSq - Sum**2/m)/(m-1))
         else:
-            raise ValueError("case must be chosen from one of the following: 'ripley',\
-                             'pima', 'heart', 'australian', 'german'")
-          
+            Mean = np.mean(X[:,:-1], axis=0)
+            Std = np.std(X[:,:-1], axis=0, ddof=1)
+
+        #Create Polynomial Basis
+        if OutFile is None:
+            XX = np.empty((m,1+p*PolynomialOrder))
+        else:
+            XX = np.lib.format.open_memmap(OutFile, mode='w+', dtype=float, \
+                                           shape=(m,1+p*PolynomialOrder))
+        for i in range(0, m, ChunkSize):
+            # Standardise Data
+            Chunk = (X[i:i+ChunkSize,:-1] - Mean) / Std
+            XX[i:i+ChunkSize,0] = 1.
+            for k in range(PolynomialOrder+1)[1:]:
+                XX[i:i+ChunkSize,1+(k-1)*p:1+k*p] = Chunk**k
+
+        return XX, t
+
+
+    def deduplicate(self, XX, t):
+
+        """
+        Collapses identical pairs of design matrix row and response
+
+        Inputs:
+        -------
+        XX              - array_like
+                        (Number of observations) x d-dimensional design matrix
+        t               - array_like
+                        responses in {0,1}
+
+        Outputs:
+        -------
+        XX              - array_like
+                        (Number of distinct observations) x d-dimensional
+                        design matrix
+        t               - array_like
+                        responses of distinct observations
+        Weights         - array_like
+                        multiplicities of distinct observations
+        """
+
+        Rows, Weights = np.unique(np.column_stack((XX, t)), axis=0, return_counts=True)
+
+        return np.ascontiguousarray(Rows[:,:-1]), Rows[:,-1].copy(), Weights.astype(float)
+
+
+    def prepareSparse(self, SourceFile, PolynomialOrder, Standardise):
+
+        """
+        Loads scipy.sparse data file and creates sparse (CSR) design matrix
+        and responses; covariates are scaled to unit variance without
+        centering, so that the design matrix keeps its sparsity pattern
+
+        Inputs:
+        -------
+        SourceFile      - string
+                        path to .npz data file
+        PolynomialOrder - int
+                        order of polynomial basis of design matrix
+        Standardise     - bool
+                        scale covariates to unit variance
+
+        Outputs:
+        -------
+        XX              - sparse matrix
+                        (Number of observations) x d-dimensional design matrix
+        t               - array_like
+                        responses in {0,1}
+        """
+
+        X = sparse.load_npz(SourceFile).tocsc()
+        m = X.shape[0]
+        t = X[:,-1].toarray().ravel()
+        X = X[:,:-1]
+
+        if self.case in RecodedCases:
+            t[t==1] = 0
+            t[t==2] = 1
+
+        # Scale Data
+        if Standardise:
+            Mean = np.asarray(X.mean(axis=0)).ravel()
+            MeanSq = np.asarray(X.multiply(X).mean(axis=0)).ravel()
+            Std = np.sqrt((MeanSq - Mean**2)*m/(m-1))
+            X = X.dot(sparse.diags(1./Std))
+
+        #Create Polynomial Basis
+        XX = sparse.hstack([sparse.csc_matrix(np.ones((m,1)))] + \
+                           [X.power(k) for k in range(PolynomialOrder+1)[1:]])
+
+        return XX.tocsr(), t
+
+    def getKey(self):
+
+        """
+        Key of the prepared data from the SHA-1 hash of the content of the
+        source file and the preprocessing options, computed on first use
+        """
+
+        if self.Key is None:
+            Hash = hashlib.sha1()
+            with open(self.SourceFile, 'rb') as File:
+                for Chunk in iter(lambda: File.read(2**20), b''):
+                    Hash.update(Chunk)
+            self.Key = '{}_{}_{}'.format(self.case, Hash.hexdigest()[:16], self.Options)
+
+        return self.Key
+
+    def getCase(self):
+        return self.case
+
+    def getPolynomialOrder(self):
+        return self.PolynomialOrder
+
     def getDimension(self):
         return self.d
-        
+
     def getDesignMatrix(self):
         return self.XX
-    
+
     def getNumOfSamples(self):
-        return self.m        
+        return self.m
 
     def getResponses(self):
-        return self.t       
\ No newline at end of file
+        return self.t
+
+    def getWeights(self):
+        return self.Weights
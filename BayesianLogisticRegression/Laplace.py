@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to compute the Laplace (Gaussian) approximation of the posterior of a
+logistic Bayesian regression problem. The posterior mode is found by Newton
+iterations (IRLS) with the analytic Hessian; the covariance is the inverse
+of the Fisher information at the mode. Results are cached in the untracked
+cache directory Data/cache/laplace/, keyed by the prepared data (see
+DataLoad.getKey) and alpha; data without such a key, e.g. coresets, are
+not cached.
+"""
+
+import os
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+from Data import DataDir
+
+
+class LaplaceApprox:
+
+    def __init__(self, Data, alpha=100., Tol=1e-12, MaxIter=100, \
+                 CacheDir=os.path.join(DataDir, 'cache', 'laplace'), ChunkSize=2**16):
+
+        """
+        Inputs:
+        -------
+        Data            - DataLoad
+                        data of the logistic regression problem
+        alpha           - float
+                        1./alpha scales prior covariance
+        Tol             - float
+                        tolerance for the norm of the Newton step
+        MaxIter         - int
+                        maximal number of Newton iterations
+        CacheDir        - string
+                        directory of cached approximations; if None,
+                        no cache is used
+        ChunkSize       - int
+                        number of rows of the design matrix processed at
+                        once (bounds memory for memory-mapped data)
+        """
+
+        # Cache key of prepared data and alpha; randomly drawn data (e.g.
+        # coresets) have no key and are not cached
+        Key = Data.getKey() if CacheDir is not None else None
+        if Key is not None:
+            Key = '{}_alpha{}'.format(Key, alpha)
+            MeanFile = '{}/LaplaceMean_{}.txt'.format(CacheDir, Key)
+            CovFile = '{}/LaplaceCov_{}.txt'.format(CacheDir, Key)
+
+            if os.path.isfile(MeanFile) and os.path.isfile(CovFile):
+                self.Mean = np.atleast_1d(np.loadtxt(MeanFile))
+                self.Cov = np.atleast_2d(np.loadtxt(CovFile))
+                return
+
+        self.XX     = Data.getDesignMatrix()
+        self.t      = Data.getResponses()
+        self.Weights = Data.getWeights()
+        self.alpha  = alpha
+        self.ChunkSize = ChunkSize
+
+        # Newton iterations for posterior mode
+        self.Mean = np.zeros(Data.getDimension())
+        for i in range(MaxIter):
+            Grad, FisherInfo = self.getGradFisherInfo(self.Mean)
+            Step = np.linalg.solve(FisherInfo, Grad)
+            self.Mean = self.Mean + Step
+            if np.linalg.norm(Step) < Tol:
+                break
+
+        # Inverse Fisher information at the mode
+        FisherInfo = self.getGradFisherInfo(self.Mean)[1]
+        self.Cov = np.linalg.inv(FisherInfo)
+
+        if Key is not None:
+            os.makedirs(CacheDir, exist_ok=True)
+            np.savetxt(MeanFile, self.Mean)
+            np.savetxt(CovFile, self.Cov)
+
+    def getGradFisherInfo(self, z):
+
+        """
+        Computes gradient of log-posterior and Fisher information at z,
+        accumulated over row chunks of the design matrix, with rows weighted
+        by their multiplicities for deduplicated data
+
+        Inputs:
+        -------
+        z               - array_like
+                        d-dimensional state
+
+        Outputs:
+        -------
+        Grad            - array_like
+                        d-dimensional gradient of log-posterior
+        FisherInfo      - array_like
+                        dxd-dimensional Fisher information (incl. prior)
+        """
+
+        d = len(z)
+        Grad = -z/self.alpha
+        FisherInfo = np.identity(d)/self.alpha
+        for i in range(0, self.XX.shape[0], self.ChunkSize):
+            X = self.XX[i:i+self.ChunkSize]
+            p = expit(X.dot(z))
+            r = self.t[i:i+self.ChunkSize] - p
+            s = p*(1.-p)
+            if self.Weights is not None:
+                r = self.Weights[i:i+self.ChunkSize]*r
+                s = self.Weights[i:i+self.ChunkSize]*s
+            Grad = Grad + X.T.dot(r)
+            if sparse.issparse(X):
+                FisherInfo = FisherInfo + X.T.dot(X.multiply(s[:,None])).toarray()
+            else:
+                FisherInfo = FisherInfo + np.dot(X.T*s, X)
+
+        return Grad, FisherInfo
+
+    def getMean(self):
+        return self.Mean
+
+    def getCov(self):
+        return self.Cov
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to evaluate the log-likelihood of a logistic Bayesian regression
+problem for a batch of proposed states. The products with the design matrix
+are accumulated over row chunks of bounded size, so that neither the
+m x (N+1) temporaries nor the design matrix itself (e.g. a memmap) need to
+fit into memory at once. Sparse (CSR) design matrices are supported, in
+which case the cost scales with the number of nonzeros. The linear term
+t.f is obtained from a precomputed d-dimensional vector; log(1+exp(f)) is
+evaluated directly, and only chunks in which exp(f) overflows are
+recomputed by the overflow-safe logaddexp(0,f). For large numbers
+of observations, the rows can be split into blocks held by a persistent
+pool of worker processes, which return partial sums that are reduced in the
+parent process. Alternatively, the log-likelihood can be estimated from a
+random subsample of rows, using a second order Taylor expansion around the
+posterior mode as control variate.
+"""
+
+import os
+import signal
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+from multiprocessing import Process, Pipe
+from SharedData import SharedRegistry, attachArray, attachMatrix
+
+
+class LogisticLikelihood:
+
+    def __init__(self, XX, t, MaxMemory=None, Weights=None):
+
+        """
+        Inputs:
+        -------
+        XX              - array_like
+                        (Number of observations) x d-dimensional design
+                        matrix; may be a memmap or a scipy.sparse matrix
+        t               - array_like
+                        responses in {0,1}
+        MaxMemory       - int
+                        bound in bytes on the temporaries of a single row
+                        chunk; if None, all rows are used at once
+        Weights         - array_like
+                        multiplicities of rows (e.g. of deduplicated data);
+                        if None, all rows have weight one
+        """
+
+        self.XX = XX
+        self.t = t
+        self.m = XX.shape[0]
+        self.MaxMemory = MaxMemory
+        self.Weights = Weights
+
+        # Linear terms t.(XX.z) = (XX.T.t).z for all states z
+        ChunkSize = self.getChunkSize(0)
+        self.XXt = np.zeros(XX.shape[1])
+        for i in range(0, self.m, ChunkSize):
+            tc = t[i:i+ChunkSize]
+            if Weights is not None:
+                tc = Weights[i:i+ChunkSize]*tc
+            self.XXt += XX[i:i+ChunkSize].T.dot(tc)
+
+
+    def getChunkSize(self, NumOfStates):
+
+        """
+        Number of rows per chunk for NumOfStates evaluation points, such
+        that the two chunk x NumOfStates temporaries and the chunk of the
+        design matrix stay within MaxMemory
+        """
+
+        if self.MaxMemory is None:
+            return self.m
+
+        RowBytes = 8*(2*NumOfStates + self.XX.shape[1])
+        return int(min(max(self.MaxMemory/RowBytes, 1), self.m))
+
+
+    def __call__(self, Proposals):
+
+        """
+        Computes the log-likelihoods of all proposals
+
+        Inputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of states
+
+        Outputs:
+        -------
+        LogLikelihoods  - array_like
+                        (N+1)-dimensional array of log-likelihoods
+        """
+
+        ChunkSize = self.getChunkSize(Proposals.shape[0])
+        LogLikelihoods = np.dot(Proposals, self.XXt)
+
+        for i in range(0, self.m, ChunkSize):
+            fs = self.XX[i:i+ChunkSize].dot(Proposals.T)
+            with np.errstate(over='ignore'):
+                Softplus = self.sumRows(np.log(1.+np.exp(fs)), i)
+            # Recompute chunks in which exp(f) overflows (f > 709)
+            if not np.all(np.isfinite(Softplus)):
+                Softplus = self.sumRows(np.logaddexp(0., fs), i)
+            LogLikelihoods -= Softplus
+
+        return LogLikelihoods
+
+
+    def sumRows(self, fs, i):
+
+        """
+        (Weighted) sum over the rows of a chunk starting at row i
+        """
+
+        if self.Weights is None:
+            return np.sum(fs, axis=0)
+
+        return np.dot(self.Weights[i:i+fs.shape[0]], fs)
+
+
+def LikelihoodWorker(Conn, Name, MaxMemory):
+
+    """
+    Loop of a worker process: attaches to its row block in shared memory and
+    returns the partial log-likelihoods of every batch of proposals received
+    until None is received; interrupts are left to the parent process, which
+    stops the worker
+
+    Inputs:
+    -------
+    Conn            - Connection
+                    end of pipe to parent process
+    Name            - string
+                    prefix under which the row block was published
+    MaxMemory       - int
+                    bound in bytes on temporaries of a single row chunk
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    t, Meta = attachArray(Name+'_t')
+    Weights = attachArray(Name+'_w')[0] if Meta['weighted'] else None
+    LogLikelihood = LogisticLikelihood(attachMatrix(Name+'_XX'), t, MaxMemory, Weights)
+    while True:
+        Proposals = Conn.recv()
+        if Proposals is None:
+            break
+        Conn.send(LogLikelihood(Proposals))
+    Conn.close()
+
+
+class ParallelLogisticLikelihood:
+
+    def __init__(self, XX, t, NumOfWorkers=None, MaxMemory=None, Weights=None):
+
+        """
+        Log-likelihood with rows of the design matrix split into contiguous
+        blocks, one per worker process. Blocks are published once in shared
+        memory; only proposals and (N+1)-dimensional partial sums are sent
+        through pipes per evaluation. Workers run until close() is called
+        or a with-block of the likelihood is left
+
+        Inputs:
+        -------
+        XX              - array_like
+                        (Number of observations) x d-dimensional design
+                        matrix; may be a memmap or a scipy.sparse matrix
+        t               - array_like
+                        responses in {0,1}
+        NumOfWorkers    - int
+                        number of worker processes; if None, all CPUs
+        MaxMemory       - int
+                        bound in bytes on temporaries of a single row chunk
+                        per worker (None = no chunking)
+        Weights         - array_like
+                        multiplicities of rows; if None, all rows have
+                        weight one
+        """
+
+        if NumOfWorkers is None:
+            NumOfWorkers = os.cpu_count()
+        m = XX.shape[0]
+        NumOfWorkers = max(min(NumOfWorkers, m), 1)
+        Bounds = np.linspace(0, m, NumOfWorkers+1).astype(int)
+
+        # Registry has to exist before workers start to share its tracker
+        self.Registry = SharedRegistry()
+        self.Conns = list()
+        self.Workers = list()
+        for k in range(NumOfWorkers):
+            Name = 'blr_lik_{}_{}_{}'.format(os.getpid(), id(self), k)
+            self.Registry.publishMatrix(Name+'_XX', XX[Bounds[k]:Bounds[k+1]])
+            self.Registry.publishArray(Name+'_t', t[Bounds[k]:Bounds[k+1]], \
+                                       weighted=Weights is not None)
+            if Weights is not None:
+                self.Registry.publishArray(Name+'_w', Weights[Bounds[k]:Bounds[k+1]])
+            Conn, WorkerConn = Pipe()
+            Worker = Process(target=LikelihoodWorker, \
+                             args=(WorkerConn, Name, MaxMemory), daemon=True)
+            Worker.start()
+            WorkerConn.close()
+            self.Conns.append(Conn)
+            self.Workers.append(Worker)
+
+
+    def __call__(self, Proposals):
+
+        """
+        Computes the log-likelihoods of all proposals as sum of the partial
+        log-likelihoods of all row blocks
+
+        Inputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of states
+
+        Outputs:
+        -------
+        LogLikelihoods  - array_like
+                        (N+1)-dimensional array of log-likelihoods
+        """
+
+        for Conn in self.Conns:
+            Conn.send(Proposals)
+
+        return np.sum([Conn.recv() for Conn in self.Conns], axis=0)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self, Timeout=10.):
+
+        """
+        Stops the worker processes and releases the shared row blocks; safe
+        to call after an interrupted evaluation or a failed worker
+        """
+
+        for Conn in self.Conns:
+            try:
+                Conn.send(None)
+            except OSError:
+                pass
+            Conn.close()
+        for Worker in self.Workers:
+            Worker.join(Timeout)
+            if Worker.is_alive():
+                Worker.terminate()
+                Worker.join()
+        self.Conns = list()
+        self.Workers = list()
+        self.Registry.close()
+
+
+class SubsampledLogisticLikelihood:
+
+    def __init__(self, XX, t, Mode, BatchSize, Weights=None, ChunkSize=2**16):
+
+        """
+        Estimate of the log-likelihood from a random subsample of rows with
+        control variates: each row's log-likelihood l_i is replaced by its
+        second order Taylor expansion q_i around Mode, whose sum over all
+        rows is computed once exactly, and only the differences l_i - q_i
+        are estimated from the subsample. The cost per evaluation is
+        O(BatchSize*d*(N+1)). Since the Taylor remainder l_i - q_i is cubic
+        in the distance of a state from Mode, the variance of the estimate
+        grows with that distance to the power of six. The estimate of the
+        log-likelihood is unbiased, but its exponential is not: IS-weights
+        computed from it are biased upwards by about half its variance (in
+        log-scale), which differs between states, so that the IS-estimates
+        are biased unless the variance is small over the posterior bulk
+
+        Inputs:
+        -------
+        XX              - array_like
+                        (Number of observations) x d-dimensional design
+                        matrix; may be a memmap or a scipy.sparse matrix
+        t               - array_like
+                        responses in {0,1}
+        Mode            - array_like
+                        d-dimensional expansion point, e.g. posterior mode
+        BatchSize       - int
+                        number of rows drawn (with replacement) per
+                        evaluation
+        Weights         - array_like
+                        multiplicities of rows; rows are drawn with
+                        probability proportional to their multiplicities
+        ChunkSize       - int
+                        number of rows processed at once in the exact pass
+        """
+
+        self.XX = XX
+        self.t = t
+        self.m = XX.shape[0]
+        self.Mode = Mode
+        self.BatchSize = BatchSize
+        Multiplicities = np.ones(self.m) if Weights is None else Weights
+        self.TotalWeight = np.sum(Multiplicities)
+        self.CumWeights = np.cumsum(Multiplicities)
+
+        # Linear predictors and log-likelihoods of all rows at Mode, and
+        # exact sums of value, gradient and Hessian of the Taylor expansion
+        d = XX.shape[1]
+        self.f0 = np.zeros(self.m)
+        self.LogLik0 = np.zeros(self.m)
+        self.SumLogLik0 = 0.
+        self.SumGrad0 = np.zeros(d)
+        self.SumHess0 = np.zeros((d,d))
+        for i in range(0, self.m, ChunkSize):
+            X = XX[i:i+ChunkSize]
+            w = Multiplicities[i:i+ChunkSize]
+            f0 = X.dot(Mode)
+            p0 = expit(f0)
+            self.f0[i:i+ChunkSize] = f0
+            self.LogLik0[i:i+ChunkSize] = t[i:i+ChunkSize]*f0 - np.logaddexp(0., f0)
+            self.SumLogLik0 += np.dot(w, self.LogLik0[i:i+ChunkSize])
+            self.SumGrad0 += X.T.dot(w*(t[i:i+ChunkSize]-p0))
+            s = w*p0*(1.-p0)
+            if sparse.issparse(X):
+                self.SumHess0 -= X.T.dot(X.multiply(s[:,None])).toarray()
+            else:
+                self.SumHess0 -= np.dot(X.T*s, X)
+
+
+    def __call__(self, Proposals):
+
+        """
+        Estimates the log-likelihoods of all proposals from one common
+        random subsample of rows
+
+        Inputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of states
+
+        Outputs:
+        -------
+        LogLikelihoods  - array_like
+                        (N+1)-dimensional array of log-likelihood estimates
+        """
+
+        # Exact sum of Taylor expansions
+        Deltas = Proposals - self.Mode
+        LogLikelihoods = self.SumLogLik0 + np.dot(Deltas, self.SumGrad0) \
+                            + 0.5*np.sum(np.dot(Deltas, self.SumHess0)*Deltas, axis=1)
+
+        # Subsample estimate of the sum of differences l_i - q_i
+        Rows = np.sort(np.searchsorted(self.CumWeights, \
+                        np.random.uniform(0, self.TotalWeight, self.BatchSize), side='right'))
+        Rows = np.minimum(Rows, self.m-1)
+        t = self.t[Rows][:,None]
+        f0 = self.f0[Rows][:,None]
+        p0 = expit(f0)
+        fs = self.XX[Rows].dot(Proposals.T)
+        Diffs = t*fs - np.logaddexp(0., fs) - self.LogLik0[Rows][:,None] \
+                - (t-p0)*(fs-f0) + 0.5*p0*(1.-p0)*(fs-f0)**2
+        LogLikelihoods += self.TotalWeight/self.BatchSize*np.sum(Diffs, axis=0)
+
+        return LogLikelihoods
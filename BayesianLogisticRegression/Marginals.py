@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to accumulate the marginal distributions of all coordinates of the
+posterior from the IS-weighted proposals of MP-(Q)MCMC, one iteration at a
+time and with memory independent of the run length. Densities are formed
+by fixed-bin histograms, whose range grows by merging pairs of bins when
+proposals of non-negligible weight fall outside of it; quantiles are
+estimated by merging digests of weighted centroids, which are small in the
+tails (t-digest). Plotting is done separately from the accumulation.
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+class WeightedHistogram:
+
+    def __init__(self, d, NumOfBins=100, BufferSize=16, Tol=1e-3):
+
+        """
+        IS-weighted histograms of all d coordinates with NumOfBins bins
+        each. The proposals of the first BufferSize iterations are buffered
+        and the initial range is taken from their weighted mean +/- 4
+        standard deviations, widened to cover those of non-negligible
+        IS-weight, so that it does not rest on the first iteration alone;
+        whenever later proposals fall outside of it, the range of their
+        coordinate is doubled towards them by merging pairs of bins.
+        Proposals whose IS-weight is below Tol times the mean weight of
+        their iteration, such as far tail proposals, do not extend the
+        range; if outside of it, their weight is counted as outlying, which
+        is at most a fraction Tol of the total weight.
+
+        Since the range can only grow, the bin width is bounded below by
+        the spread of all proposals of non-negligible weight added so far.
+        If iterations with substantial weight far from the posterior are
+        added, e.g. before the end of Burn-In or after a poor InitMean, the
+        posterior is resolved by correspondingly fewer bins
+
+        Inputs:
+        -------
+        d               - int
+                        dimension of states
+        NumOfBins       - int
+                        number of bins per coordinate (rounded up to even)
+        BufferSize      - int
+                        number of iterations buffered before the initial
+                        range is fixed
+        Tol             - float
+                        relative IS-weight below which proposals do not
+                        extend the range
+        """
+
+        self.d = d
+        self.NumOfBins = 2*int(np.ceil(NumOfBins/2.))
+        self.BufferSize = BufferSize
+        self.Tol = Tol
+        self.Counts = np.zeros((d,self.NumOfBins))
+        self.Outlying = np.zeros(d)
+        self.Buffer = list()
+        self.Lower = None
+        self.Width = None
+        self.Total = 0.
+
+
+    def extend(self, j, Min, Max):
+
+        """
+        Doubles the range of coordinate j, merging pairs of bins, until it
+        covers [Min,Max]
+        """
+
+        B = self.NumOfBins
+        while Min < self.Lower[j] or Max >= self.Lower[j] + B*self.Width[j]:
+            Merged = self.Counts[j].reshape(int(B/2),2).sum(axis=1)
+            self.Counts[j] = 0.
+            if Min < self.Lower[j]:
+                # Extend downwards, old bins fill the upper half
+                self.Counts[j,int(B/2):] = Merged
+                self.Lower[j] -= B*self.Width[j]
+            else:
+                # Extend upwards, old bins fill the lower half
+                self.Counts[j,:int(B/2)] = Merged
+            self.Width[j] *= 2.
+
+
+    def add(self, Proposals, Pstates):
+
+        """
+        Adds the proposals of one iteration with their IS-weights
+
+        Inputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of proposals
+        Pstates         - array_like
+                        (N+1)-dimensional array of normalised IS-weights
+        """
+
+        if self.Lower is None:
+            self.Buffer.append((np.array(Proposals), np.array(Pstates)))
+            if len(self.Buffer) >= self.BufferSize:
+                self.flush()
+            return
+
+        self.binProposals(Proposals, Pstates)
+
+
+    def flush(self):
+
+        """
+        Fixes the initial range from the weighted mean and standard
+        deviation of the buffered proposals and the extent of those of
+        non-negligible weight, and bins them
+        """
+
+        if self.Lower is not None or len(self.Buffer) == 0:
+            return
+
+        Buffer = self.Buffer
+        self.Buffer = list()
+        Proposals = np.vstack([Props for Props, Ps in Buffer])
+        Pstates = np.concatenate([Ps for Props, Ps in Buffer])
+        Mean = np.dot(Pstates, Proposals)/np.sum(Pstates)
+        Std = np.sqrt(np.dot(Pstates, (Proposals-Mean)**2)/np.sum(Pstates))
+        Std[~(Std > 0.)] = 1.
+        Large = np.concatenate([Ps >= self.Tol*np.mean(Ps) for Props, Ps in Buffer])
+        Lower = np.minimum(Mean - 4.*Std, np.min(Proposals[Large], axis=0))
+        Upper = np.maximum(Mean + 4.*Std, np.max(Proposals[Large], axis=0))
+        self.Lower = Lower
+        self.Width = (1.+1e-9)*(Upper - Lower)/self.NumOfBins
+
+        for Props, Ps in Buffer:
+            self.binProposals(Props, Ps)
+
+
+    def binProposals(self, Proposals, Pstates):
+
+        """
+        Bins the proposals of one iteration, extending the ranges of
+        coordinates with proposals of non-negligible weight outside of them
+        """
+
+        B = self.NumOfBins
+
+        # Extend ranges of coordinates with proposals outside of them
+        Large = Pstates >= self.Tol*np.mean(Pstates)
+        if np.any(Large):
+            Min = np.min(Proposals[Large], axis=0)
+            Max = np.max(Proposals[Large], axis=0)
+            for j in np.nonzero((Min < self.Lower) | (Max >= self.Lower + B*self.Width))[0]:
+                self.extend(j, Min[j], Max[j])
+
+        # Bin all coordinates at once in a flattened d x B array; the
+        # weights of remaining proposals outside of the ranges are outlying
+        Bins = np.floor((Proposals - self.Lower)/self.Width)
+        Inside = (Bins >= 0) & (Bins < B)
+        self.Outlying += np.dot(Pstates, ~Inside)
+        Bins = np.clip(Bins, 0, B-1).astype(int) + B*np.arange(self.d)
+        self.Counts += np.bincount(Bins.ravel(), weights=(Pstates[:,None]*Inside).ravel(), \
+                                   minlength=self.d*B).reshape(self.d,B)
+        self.Total += np.sum(Pstates)
+
+
+    def getDensity(self):
+
+        """
+        Marginal densities of all coordinates, normalised by the total
+        weight including outlying weight
+
+        Outputs:
+        -------
+        Edges           - array_like
+                        d x (NumOfBins+1)-dimensional array of bin edges
+        Density         - array_like
+                        d x NumOfBins-dimensional array of densities
+        """
+
+        self.flush()
+        if self.Total == 0.:
+            raise ValueError('No proposals added to histogram')
+
+        Edges = self.Lower[:,None] + self.Width[:,None]*np.arange(self.NumOfBins+1)
+        Density = self.Counts/(self.Total*self.Width[:,None])
+
+        return Edges, Density
+
+
+class WeightedDigest:
+
+    def __init__(self, d, Compression=100, BufferSize=1000):
+
+        """
+        Merging digests of IS-weighted centroids for all d coordinates.
+        Added values are buffered and merged into at most Compression+1
+        centroids per coordinate, whose sizes are limited by the arcsine
+        scale function, so that quantiles in the tails are resolved finely
+
+        Inputs:
+        -------
+        d               - int
+                        dimension of states
+        Compression     - int
+                        number of centroids per coordinate
+        BufferSize      - int
+                        number of buffered states before merging
+        """
+
+        self.d = d
+        self.Compression = Compression
+        self.BufferSize = BufferSize
+        self.Means = [np.zeros(0) for j in range(d)]
+        self.Weights = [np.zeros(0) for j in range(d)]
+        self.Min = np.full(d, np.inf)
+        self.Max = np.full(d, -np.inf)
+        self.Buffer = None
+        self.nb = 0
+
+
+    def add(self, Proposals, Pstates):
+
+        """
+        Adds the proposals of one iteration with their IS-weights
+
+        Inputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of proposals
+        Pstates         - array_like
+                        (N+1)-dimensional array of normalised IS-weights
+        """
+
+        k = len(Pstates)
+        if self.Buffer is None:
+            Size = max(self.BufferSize, k)
+            self.Buffer = np.empty((Size,self.d))
+            self.BufferWeights = np.empty(Size)
+        if self.nb + k > len(self.Buffer):
+            self.merge()
+
+        self.Buffer[self.nb:self.nb+k] = Proposals
+        self.BufferWeights[self.nb:self.nb+k] = Pstates
+        self.nb += k
+        np.minimum(self.Min, np.min(Proposals, axis=0), out=self.Min)
+        np.maximum(self.Max, np.max(Proposals, axis=0), out=self.Max)
+
+
+    def merge(self):
+
+        """
+        Merges buffered values into the centroids of all coordinates
+        """
+
+        if self.nb == 0:
+            return
+
+        for j in range(self.d):
+            x = np.concatenate((self.Means[j], self.Buffer[:self.nb,j]))
+            w = np.concatenate((self.Weights[j], self.BufferWeights[:self.nb]))
+            Order = np.argsort(x, kind='mergesort')
+            x = x[Order]
+            w = w[Order]
+
+            # Group values by integer part of arcsine scale at their
+            # cumulative weight
+            q = np.clip((np.cumsum(w) - 0.5*w)/np.sum(w), 0., 1.)
+            Groups = np.floor(self.Compression*(np.arcsin(2.*q-1.)/np.pi + 0.5)).astype(int)
+            Groups -= Groups[0]
+            Weights = np.bincount(Groups, weights=w)
+            Means = np.bincount(Groups, weights=w*x)
+            Keep = Weights > 0.
+            self.Weights[j] = Weights[Keep]
+            self.Means[j] = Means[Keep]/Weights[Keep]
+
+        self.nb = 0
+
+
+    def getQuantiles(self, Probs):
+
+        """
+        Quantiles of all coordinates, interpolated linearly between the
+        centroids and the extreme values
+
+        Inputs:
+        -------
+        Probs           - array_like
+                        probabilities in [0,1]
+
+        Outputs:
+        -------
+        Quantiles       - array_like
+                        (Number of probabilities) x d-dimensional array
+        """
+
+        self.merge()
+        if len(self.Weights[0]) == 0:
+            raise ValueError('No proposals added to digest')
+
+        Probs = np.atleast_1d(Probs)
+        Quantiles = np.zeros((len(Probs),self.d))
+        for j in range(self.d):
+            w = self.Weights[j]
+            q = (np.cumsum(w) - 0.5*w)/np.sum(w)
+            Quantiles[:,j] = np.interp(Probs, np.concatenate(([0.], q, [1.])), \
+                                np.concatenate(([self.Min[j]], self.Means[j], [self.Max[j]])))
+
+        return Quantiles
+
+
+def PlotMarginalDensity(Edges, Density, Label="IS Histogram"):
+
+    """
+    Plots the histogram of a marginal density
+
+    Inputs:
+    ------
+    Edges       - array_like
+                (NumOfBins+1)-dimensional array of bin edges
+    Density     - array_like
+                NumOfBins-dimensional array of densities
+    Label       - string
+                label of histogram
+
+    Outputs:
+    -------
+    Plot
+    """
+
+    Fig = plt.figure()
+    SubPlot = Fig.add_subplot(111)
+    SubPlot.hist(Edges[:-1], Edges, weights = Density, label = Label)
+
+    return Fig
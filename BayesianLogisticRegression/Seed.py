@@ -12,6 +12,45 @@ proposals and importance sampling applied to Bayesian linear regression.
 import numpy as np
 #from diversipy import *
 
+def CudSeed(d, PowerOfTwo, cuds=None):
+
+    """
+    Function to generate the unshifted d-dimensional cud seed
+
+    inputs:
+    -------   
+    d               - int
+                    dimension of posterior    
+    PowerOfTwo      - int in [10,18]
+                    defines size S of seed by S=2**PowerOfTwo-1
+    cuds            - array_like
+                    1-dimensional cud point sequence; if None, it is
+                    loaded from ../CUDs/ChenEtAl/
+
+    outputs:
+    ------- 
+    xs              - array_like
+                    (2**PowerOfTwo) x d-Array of seed
+    """
+
+    if cuds is None:
+        # Load cud point sequence
+        cuds = np.load('../CUDs/ChenEtAl/CudsChen_{}.npy'.format(PowerOfTwo))
+    
+    # Create d-dimensional sequence by shifted cud sequence
+    UsedLength = int(cuds.shape[0]/d)*d
+    TrimmedCuds = cuds[:UsedLength]
+    xs = TrimmedCuds
+    
+    for i in range(d)[1:]:
+        xs = np.append(xs, np.roll(TrimmedCuds,-i))
+    
+    xs = xs.reshape(UsedLength,d)
+    xs = np.append(np.zeros(d)+1e-9,xs).reshape(UsedLength+1,d)
+
+    return xs
+
+
 def SeedGen(d, PowerOfTwo, Stream):
 
     """
@@ -37,20 +76,10 @@ def SeedGen(d, PowerOfTwo, Stream):
         xs = np.random.uniform(0,1,(int((2**PowerOfTwo-1)/d)*d,d))
 
     elif Stream == 'cud':
-        # Load cud point sequence
-        cuds = np.load('../CUDs/ChenEtAl/CudsChen_{}.npy'.format(PowerOfTwo))
-        
-        # Create d-dimensional sequence by shifted cud sequence
-        UsedLength = int(cuds.shape[0]/d)*d
-        TrimmedCuds = cuds[:UsedLength]
-        xs = TrimmedCuds
-        
-        for i in range(d)[1:]:
-            xs = np.append(xs, np.roll(TrimmedCuds,-i))
+        # Load d-dimensional cud point sequence
+        xs = CudSeed(d, PowerOfTwo)
         
-     
-        xs = xs.reshape(UsedLength,d)
-        xs = np.append(np.zeros(d)+1e-9,xs).reshape(UsedLength+1,d)
+        # Random shift of cud sequence
         u_rand = np.random.uniform(0,1,1) #np.random.uniform(-1,0,d)
         xs_sh = xs + u_rand
         xs = xs_sh - np.floor(xs_sh)  
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to share data between parallel worker processes without copies.
+Arrays (design matrix, responses, CUD seeds) are published once into named
+blocks of shared memory by the parent process; workers attach to them by
+name and obtain numpy views onto the same memory. Each block starts with a
+small header holding dtype and shape, so that the name is all a worker
+needs to know.
+"""
+
+import ast
+import sys
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from scipy import sparse
+from Seed import CudSeed
+
+
+# Size in bytes of header with dtype, shape and meta data of a block
+HeaderSize = 512
+
+# Blocks attached by this process, kept open while their views are in use
+Attached = dict()
+
+
+class SharedRegistry:
+
+    def __init__(self):
+
+        """
+        Registry of shared memory blocks published by this process; blocks
+        are released by close() or at the end of a with-statement. Worker
+        processes should be started after the registry is created, so that
+        they share its resource tracker
+        """
+
+        self.Blocks = dict()
+        resource_tracker.ensure_running()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def publishArray(self, Name, Array, **Meta):
+
+        """
+        Copies array into a new named block of shared memory
+
+        Inputs:
+        -------
+        Name            - string
+                        name of shared memory block
+        Array           - array_like
+                        array to be published
+        Meta            - dict
+                        additional literals stored in the header
+
+        Outputs:
+        -------
+        View            - array_like
+                        array view onto the shared memory block
+        """
+
+        Array = np.ascontiguousarray(Array)
+        Header = repr(dict(dtype=Array.dtype.str, shape=Array.shape, **Meta)).encode()
+        if len(Header) > HeaderSize:
+            raise ValueError('Meta data of shared array too large')
+
+        Block = shared_memory.SharedMemory(name=Name, create=True, \
+                                           size=HeaderSize+max(Array.nbytes, 1))
+        Block.buf[:len(Header)] = Header
+        Block.buf[len(Header):HeaderSize] = b' '*(HeaderSize-len(Header))
+        View = np.ndarray(Array.shape, Array.dtype, buffer=Block.buf, offset=HeaderSize)
+        View[...] = Array
+        self.Blocks[Name] = Block
+
+        return View
+
+    def publishData(self, Name, Data):
+
+        """
+        Publishes design matrix (dense or CSR), responses and row weights (if
+        any) of a DataLoad object under the prefix Name
+
+        Inputs:
+        -------
+        Name            - string
+                        prefix of names of shared memory blocks
+        Data            - DataLoad
+                        data of the logistic regression problem
+        """
+
+        Weights = Data.getWeights()
+        self.publishArray(Name+'_t', Data.getResponses(), case=Data.getCase(), \
+                          key=Data.getKey(), order=Data.getPolynomialOrder(), \
+                          weighted=Weights is not None)
+        self.publishMatrix(Name+'_XX', Data.getDesignMatrix())
+        if Weights is not None:
+            self.publishArray(Name+'_w', Weights)
+
+    def publishMatrix(self, Name, XX):
+
+        """
+        Publishes a dense or sparse (as CSR) matrix under the prefix Name
+
+        Inputs:
+        -------
+        Name            - string
+                        prefix of names of shared memory blocks
+        XX              - array_like or sparse matrix
+                        matrix to be published
+        """
+
+        if sparse.issparse(XX):
+            XX = sparse.csr_matrix(XX)
+            self.publishArray(Name+'data', XX.data, sparse=True, shape2d=XX.shape)
+            self.publishArray(Name+'indices', XX.indices)
+            self.publishArray(Name+'indptr', XX.indptr)
+        else:
+            self.publishArray(Name+'data', XX, sparse=False)
+
+    def publishSeed(self, Name, d, PowerOfTwo):
+
+        """
+        Publishes the unshifted d-dimensional CUD seed; samplers attached to
+        it apply their own random shift per iteration
+
+        Inputs:
+        -------
+        Name            - string
+                        name of shared memory block
+        d               - int
+                        dimension of seed points
+        PowerOfTwo      - int in [10,18]
+                        defines size S of seed by S=2**PowerOfTwo-1
+        """
+
+        self.publishArray(Name, CudSeed(d, PowerOfTwo))
+
+    def close(self):
+
+        """
+        Releases all blocks published by this process
+        """
+
+        for Block in self.Blocks.values():
+            Block.close()
+            Block.unlink()
+        self.Blocks = dict()
+
+
+def attachArray(Name):
+
+    """
+    Attaches to a named block of shared memory
+
+    Inputs:
+    -------
+    Name            - string
+                    name of shared memory block
+
+    Outputs:
+    -------
+    View            - array_like
+                    read-only array view onto the shared memory block
+    Meta            - dict
+                    header of the block
+    """
+
+    if Name not in Attached:
+        # Blocks are owned by the publishing process. Workers started by
+        # multiprocessing share its resource tracker, so attaching does not
+        # transfer ownership; from Python 3.13 on, tracking is switched off
+        if sys.version_info >= (3, 13):
+            Block = shared_memory.SharedMemory(name=Name, track=False)
+        else:
+            Block = shared_memory.SharedMemory(name=Name)
+        Attached[Name] = Block
+
+    Block = Attached[Name]
+    Meta = ast.literal_eval(bytes(Block.buf[:HeaderSize]).decode().strip())
+    View = np.ndarray(Meta['shape'], np.dtype(Meta['dtype']), buffer=Block.buf, \
+                      offset=HeaderSize)
+    View.flags.writeable = False
+
+    return View, Meta
+
+
+def attachMatrix(Name):
+
+    """
+    Attaches to a dense or sparse matrix published under the prefix Name
+
+    Inputs:
+    -------
+    Name            - string
+                    prefix of names of shared memory blocks
+
+    Outputs:
+    -------
+    XX              - array_like or sparse matrix
+                    read-only view onto the shared matrix
+    """
+
+    Data, Meta = attachArray(Name+'data')
+    if not Meta['sparse']:
+        return Data
+
+    return sparse.csr_matrix((Data, attachArray(Name+'indices')[0], \
+                              attachArray(Name+'indptr')[0]), \
+                             shape=Meta['shape2d'], copy=False)
+
+
+class SharedDataLoad:
+
+    def __init__(self, Name):
+
+        """
+        Data of a logistic regression problem attached from shared memory,
+        with the same interface as DataLoad
+
+        Inputs:
+        -------
+        Name            - string
+                        prefix under which the data was published
+        """
+
+        self.t, Meta = attachArray(Name+'_t')
+        self.case = Meta['case']
+        self.Key = Meta['key']
+        self.PolynomialOrder = Meta['order']
+        self.XX = attachMatrix(Name+'_XX')
+        [self.m,self.d] = self.XX.shape
+        self.Weights = attachArray(Name+'_w')[0] if Meta['weighted'] else None
+
+    def getKey(self):
+        return self.Key
+
+    def getCase(self):
+        return self.case
+
+    def getPolynomialOrder(self):
+        return self.PolynomialOrder
+
+    def getDimension(self):
+        return self.d
+
+    def getDesignMatrix(self):
+        return self.XX
+
+    def getNumOfSamples(self):
+        return self.m
+
+    def getResponses(self):
+        return self.t
+
+    def getWeights(self):
+        return self.Weights
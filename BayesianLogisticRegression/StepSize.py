@@ -11,6 +11,10 @@ size (ESS) of the pseudo-random version of the algorithm (for N=4 proposals)
 over a trial set of possible step sizes. Maximal ESS corresponds to minimal 
 empirical sample variance.
 
+Alternatively (Adaptive = True), the step size is tuned during the burn-in
+of a single run by stochastic approximation of the maximal acceptance rate
+and frozen afterwards, which avoids the sweep over the trial set.
+
 """
 
 
@@ -18,7 +22,7 @@ import time
 import numpy as np
 from BayesianLogisticRegression import BayesianLogReg
 from Data import DataLoad
-from scipy.optimize import root
+from Laplace import LaplaceApprox
 from ESS import AutoCorrelation, EffectiveSampleSize
 
 
@@ -36,11 +40,15 @@ if __name__ == '__main__':
     df          = 250.           # Degree of freedom for student distribution
     alpha       = 100.           # Scaling of the prior covariance
     BurnInPowerOfTwo = 12        # Define BurnIn length
+    Adaptive    = False          # Tune step size within a single run
   
 
     # Means of ESS    
     EssMeans    = np.zeros((len(Range), len(Cases)))     
     
+    # Step sizes from adaptive runs
+    AdaptedStepSizes = np.zeros(len(Cases))
+    
     c=0      
     for Case in Cases:
 
@@ -49,33 +57,29 @@ if __name__ == '__main__':
         #################
     
         Data        = DataLoad(Case)
-        d           = Data.GetDimension()
-        XX          = Data.GetDesignMatrix()
-        t           = Data.GetResponses()
-        m           = Data.GetNumOfSamples()
+        d           = Data.getDimension()
   
     
         ###############################
         # Initial Mean and Covariance #
         ###############################       
         
-        # Compute initial mean via root of posterior derivative
-        def PostDer(z):
-            f = np.dot(XX,z)
-            PostDer = np.dot(XX.T, t - (np.exp(f)/(1+np.exp(f)))) - 1./alpha*np.dot(np.identity(d),z)   
-            return PostDer 
-    
-        RootRes = root(PostDer, np.zeros(d), tol=1e-12)
-        InitMean = RootRes.x   
+        # Laplace approximation: posterior mode by Newton iterations and
+        # inverse Fisher information at the mode
+        Laplace     = LaplaceApprox(Data, alpha)
+        InitMean    = Laplace.getMean()
+        InitCov     = Laplace.getCov()
 
-        # Compute initital covariance as Inverse Fisher Info
-        f = np.dot(XX,InitMean)
-        p = 1./(1+np.exp(-f))
-        v = p*(np.ones(m)-p)
-        v1 = np.multiply(v,XX.T)
-        Ginit = np.dot(v1,XX) + np.identity(d)/alpha   
-        InitCov = np.linalg.inv(Ginit)
 
+        if Adaptive:
+            
+            # Single run with step size adaptation during BurnIn
+            BLR = BayesianLogReg(N, Range[0], PowerOfTwo, InitMean, InitCov, \
+                    df, Case, alpha, Stream, AdaptIter=int(2**BurnInPowerOfTwo/N))
+            AdaptedStepSizes[c] = BLR.getStepSize()
+            c+=1
+            continue
+            
 
         s=0
         for StepSize in Range:
@@ -109,7 +113,7 @@ if __name__ == '__main__':
             BurnIn = 2**BurnInPowerOfTwo        
         
             # Samples
-            Samples = BLR.GetSamples(BurnIn)
+            Samples = BLR.getSamples(BurnIn)
             
             # Initialise autocorrelations and effective sample sizes
             AutoCor = np.zeros((len(Samples), d))
@@ -131,15 +135,16 @@ if __name__ == '__main__':
         c+=1
         print ("c =", c)
         
-    print ("ESS Means = \n" , EssMeans)        
-    
-    
     ############################
     # Choose optimal step size #
     ############################
     
-    StepSizes = np.zeros(len(Cases))
-    for k in range(len(Cases)):
-        Kmax = np.where(EssMeans[:,k]==EssMeans[:,k].max())
-        StepSizes[k] = Range[Kmax]
+    if Adaptive:
+        StepSizes = AdaptedStepSizes
+    else:
+        print ("ESS Means = \n" , EssMeans)        
+        StepSizes = np.zeros(len(Cases))
+        for k in range(len(Cases)):
+            Kmax = np.where(EssMeans[:,k]==EssMeans[:,k].max())
+            StepSizes[k] = Range[Kmax]
     print ("StepSizes for {} = ".format(Cases), StepSizes)
\ No newline at end of file
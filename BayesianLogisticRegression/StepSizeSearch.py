@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to determine a good choice of step size for the MP-(Q)MCMC by an
+explicit sweep over a trial set of step sizes, using successive halving:
+all candidates are run in parallel on a short seed first, the worse half
+in terms of effective sample size (ESS) per CPU-second is discarded, and
+only the survivors are extended towards the full seed length. Results are
+cached per (case, N, df, alpha) in ./results/StepSizes/. The data set is
+published once in shared memory, to which all workers attach.
+
+"""
+
+
+import os
+import time
+import numpy as np
+from multiprocessing import Pool
+from BayesianLogisticRegression import BayesianLogReg
+from Data import DataLoad
+from Laplace import LaplaceApprox
+from SharedData import SharedRegistry, SharedDataLoad
+from ESS import AutoCorrelation, EffectiveSampleSize
+
+
+def EssPerCpuTime(Args):
+
+    """
+    Runs a single pseudo-random MP-MCMC simulation and computes its mean
+    ESS over all dimensions per CPU-second
+
+    Inputs:
+    ------
+    Args        - tuple
+                (Case, N, StepSize, PowerOfTwo, InitMean, InitCov, df,
+                alpha, Stream, BurnIn, DataName), where DataName is the
+                name under which the data was published in shared memory
+
+    Outputs:
+    -------
+    EssRate     - float
+                mean ESS per CPU-second
+    """
+
+    Case, N, StepSize, PowerOfTwo, InitMean, InitCov, df, alpha, \
+        Stream, BurnIn, DataName = Args
+
+    # Run simulation
+    StartTime = time.process_time()
+    BLR = BayesianLogReg(N, StepSize, PowerOfTwo, InitMean, InitCov, \
+                         df, Case, alpha, Stream, Data=SharedDataLoad(DataName))
+    CpuTime = time.process_time() - StartTime
+
+    # Compute mean effective sample size
+    Samples = BLR.getSamples(BurnIn)
+    ESS = np.zeros(Samples.shape[1])
+    for i in range(Samples.shape[1]):
+        AutoCor = AutoCorrelation(Samples[:,i])
+        ESS[i] = EffectiveSampleSize(Samples[:,i], AutoCor)
+
+    return np.mean(ESS)/CpuTime
+
+
+def SuccessiveHalving(Case, Range, N, PowerOfTwo, InitMean, InitCov, df, \
+                      alpha, Stream='iid', MinPowerOfTwo=12, \
+                      BurnInFraction=2**-3, NumOfWorkers=None, \
+                      CacheDir='./results/StepSizes'):
+
+    """
+    Finds the step size maximising ESS per CPU-second among a trial set by
+    successive halving
+
+    Inputs:
+    ------
+    Case            - string
+                    determines the data used
+    Range           - array_like
+                    trial set of step sizes
+    N               - int
+                    number of proposals per iteration
+    PowerOfTwo      - int
+                    defines size S=2**PowerOfTwo-1 of seed for final round
+    InitMean        - array_like
+                    d-dimensional initial proposal mean
+    InitCov         - array_like
+                    dxd-dimensional initial proposal covariance
+    df              - float >2
+                    degree of freedom for student distribution
+    alpha           - float
+                    1./alpha scales prior covariance
+    Stream          - string
+                    either 'cud' or 'iid'; defining what seed is used
+    MinPowerOfTwo   - int
+                    defines minimal size of seed in first round
+    BurnInFraction  - float
+                    fraction of samples discarded as Burn-In in each run
+    NumOfWorkers    - int
+                    number of parallel processes; if None, all CPUs
+    CacheDir        - string
+                    directory of cached results
+
+    Outputs:
+    -------
+    StepSize        - float
+                    selected step size
+    """
+
+    # Load cached result if available
+    CacheFile = '{}/StepSize_{}_N{}_df{}_alpha{}.txt'.format(CacheDir, \
+                                                    Case, N, df, alpha)
+    if os.path.isfile(CacheFile):
+        return float(np.loadtxt(CacheFile))
+
+    # Seed sizes of rounds increase by factors of two up to PowerOfTwo,
+    # starting no lower than MinPowerOfTwo
+    NumOfRounds = max(int(np.ceil(np.log2(len(Range)))), 1)
+    PowersOfTwo = np.arange(max(PowerOfTwo-NumOfRounds+1, MinPowerOfTwo), PowerOfTwo+1)
+
+    # Publish data once for all workers
+    DataName = 'blr_{}_{}'.format(Case, os.getpid())
+    Candidates = np.array(Range)
+    with SharedRegistry() as Registry, Pool(NumOfWorkers) as Workers:
+        Registry.publishData(DataName, DataLoad(Case))
+        for P in PowersOfTwo:
+
+            BurnIn = int(BurnInFraction*2**P)
+            EssRates = np.array(Workers.map(EssPerCpuTime, \
+                        [(Case, N, StepSize, P, InitMean, InitCov, df, \
+                          alpha, Stream, BurnIn, DataName) for StepSize in Candidates]))
+            print ("Seed size 2**{}: step sizes = {}, ESS/CPU-second = {}".format( \
+                   P, Candidates, EssRates))
+
+            # Keep better half of candidates, and the best one after the
+            # final round on the full seed
+            Order = np.argsort(EssRates)[::-1]
+            if P < PowerOfTwo:
+                Candidates = Candidates[Order[:int(np.ceil(len(Candidates)/2.))]]
+            else:
+                Candidates = Candidates[Order[:1]]
+
+    # Cache result
+    StepSize = Candidates[0]
+    os.makedirs(CacheDir, exist_ok=True)
+    np.savetxt(CacheFile, np.array([StepSize]))
+
+    return StepSize
+
+
+if __name__ == '__main__':
+
+    #############################
+    # Parameters for simulation #
+    #############################
+
+    Range       = np.linspace(1.0, 1.3, 13) # Range of step sizes
+    Cases       = ['ripley' , 'pima', 'heart', 'australian', 'german']
+    N           = 4              # Number of proposed states
+    PowerOfTwo  = 15             # Generates size of seed = 2**PowerOfTwo-1
+    MinPowerOfTwo = 12           # Size of seed in first round
+    Stream      = 'iid'          # Choose between 'iid' or 'cud' seed
+    df          = 250.           # Degree of freedom for student distribution
+    alpha       = 100.           # Scaling of the prior covariance
+
+
+    StepSizes = np.zeros(len(Cases))
+    for c, Case in enumerate(Cases):
+
+        #################
+        # Generate Data #
+        #################
+
+        Data        = DataLoad(Case)
+
+
+        ###############################
+        # Initial Mean and Covariance #
+        ###############################
+
+        # Laplace approximation: posterior mode by Newton iterations and
+        # inverse Fisher information at the mode
+        Laplace     = LaplaceApprox(Data, alpha)
+        InitMean    = Laplace.getMean()
+        InitCov     = Laplace.getCov()
+
+
+        ######################
+        # Successive halving #
+        ######################
+
+        StartTime = time.time()
+        StepSizes[c] = SuccessiveHalving(Case, Range, N, PowerOfTwo, InitMean, \
+                            InitCov, df, alpha, Stream, MinPowerOfTwo)
+        print ("Wall time needed =", time.time() - StartTime)
+
+    print ("StepSizes for {} = ".format(Cases), StepSizes)
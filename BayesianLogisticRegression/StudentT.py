@@ -11,7 +11,7 @@ Multivariate student's t continuous random variables
 
 import numpy as np
 from scipy.stats import gamma, norm, multivariate_normal
-from scipy.special import gamma as GammaFun
+from scipy.special import gamma as GammaFun, gammaln as GammaLn
 import matplotlib.pylab as plt
 
 
@@ -165,11 +165,12 @@ def multivariate_t_LogPdf(X, Mean, Sigma, df=np.inf):
         vals = np.log(multivariate_normal.pdf(X, Mean, Sigma))
         
     else: 
-        Term1 = np.log(GammaFun((df+d)/2.)) 
-        Term2 = - np.log(GammaFun(df/2.)*df**(d/2.)*np.pi**(d/2.)*np.linalg.det(Sigma)**(1./2))
+        Term1 = GammaLn((df+d)/2.) 
+        Term2 = - (GammaLn(df/2.) + d/2.*np.log(df*np.pi) + 0.5*np.linalg.slogdet(Sigma)[1])
         if len(X.shape)>1:
-            Term3 = -(df+d)/2. * np.log((1. + 1./df * np.dot( np.dot( (X-Mean), np.linalg.inv(Sigma)), \
-                                        (X-Mean).T).diagonal(0)))
+            Residuals = X-Mean
+            Term3 = -(df+d)/2. * np.log((1. + 1./df * np.sum( np.dot( Residuals, \
+                                        np.linalg.inv(Sigma)) * Residuals, axis=1)))
         else:
             Term3 = -(df+d)/2. * np.log((1. + 1./df * np.dot( np.dot( (X-Mean), np.linalg.inv(Sigma)), \
                                         (X-Mean))))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to provide preallocated arrays for the iterations of MP-(Q)MCMC.
+All arrays of the per-iteration quantities (proposals, residuals, weighted
+sums and covariances, IS-weights and sampler-specific quantities) are
+allocated once, and the computations of an iteration write into them
+through the out-arguments of numpy ufuncs and BLAS calls, so that small
+numbers of proposals are not dominated by the cost of allocations. The
+normalisation of IS-weights and the resampling of states are fused into
+one kernel.
+"""
+
+import numpy as np
+
+
+class IterationWorkspace:
+
+    def __init__(self, N, d):
+
+        """
+        Preallocated arrays for iterations with N+1 states of dimension d.
+        Arrays returned by the methods are views onto the workspace and are
+        overwritten in the next iteration
+
+        Inputs:
+        -------
+        N               - int
+                        number of proposals per iteration
+        d               - int
+                        dimension of states
+        """
+
+        self.Proposals = np.empty((N+1,d))
+        self.Residuals = np.empty((N+1,d))
+        self.Products = np.empty((N+1,d))
+        self.SqrtPstates = np.empty(N+1)
+        self.WeightedSum = np.empty(d)
+        self.WeightedCov = np.empty((d,d))
+        self.LogPstates = np.empty(N+1)
+        self.Pstates = np.empty(N+1)
+        self.PstatesSum = np.empty(N+1)
+        self.Arrays = dict()
+
+
+    def array(self, Name, Shape):
+
+        """
+        Sampler-specific array of given name, allocated on first use
+        """
+
+        if Name not in self.Arrays:
+            self.Arrays[Name] = np.empty(Shape)
+
+        return self.Arrays[Name]
+
+
+    def setStates(self, States, New, Current, I=0):
+
+        """
+        Writes the value Current of the current state at index I of States
+        and the values New of the new proposals at all other indices;
+        Current may be a row of States from the previous iteration
+
+        Inputs:
+        -------
+        States          - array_like
+                        workspace array with N+1 rows
+        New             - array_like
+                        array of N rows of values of new proposals
+        Current         - array_like
+                        value of current state
+        I               - int
+                        index of current state
+
+        Outputs:
+        -------
+        States          - array_like
+                        array of values of all states
+        """
+
+        States[I] = Current
+        States[:I] = New[:I]
+        States[I+1:] = New[I:]
+
+        return States
+
+
+    def setProposals(self, y, xI, I=0):
+
+        """
+        Writes the current state xI at index I and the new proposals y at
+        all other indices; xI may be a row of the previous proposals
+
+        Inputs:
+        -------
+        y               - array_like
+                        N x d-dimensional array of new proposals
+        xI              - array_like
+                        d-dimensional current state
+        I               - int
+                        index of current state
+
+        Outputs:
+        -------
+        Proposals       - array_like
+                        (N+1) x d-dimensional array of proposals
+        """
+
+        return self.setStates(self.Proposals, y, xI, I)
+
+
+    def quadraticForms(self, X, A, Name):
+
+        """
+        Quadratic forms x^T A x of all rows x of X, without forming X A X^T
+
+        Inputs:
+        -------
+        X               - array_like
+                        k x d-dimensional array with k <= N+1
+        A               - array_like
+                        dxd-dimensional array
+        Name            - string
+                        name of workspace array receiving the result
+
+        Outputs:
+        -------
+        Forms           - array_like
+                        k-dimensional array of quadratic forms
+        """
+
+        Products = self.Products[:len(X)]
+        np.dot(X, A, out=Products)
+        np.multiply(Products, X, out=Products)
+
+        return np.sum(Products, axis=1, out=self.array(Name, len(X)))
+
+
+    def residuals(self, Mean):
+
+        """
+        Differences of proposals and Mean
+        """
+
+        return np.subtract(self.Proposals, Mean, out=self.Residuals)
+
+
+    def weightedSum(self, Pstates):
+
+        """
+        IS-weighted sum of proposals as posterior mean estimate
+        """
+
+        return np.dot(Pstates, self.Proposals, out=self.WeightedSum)
+
+
+    def weightedCov(self, Pstates, Mean):
+
+        """
+        IS-weighted sum of outer products of residuals to Mean as posterior
+        covariance estimate, formed as the Gram matrix B^T B of the residuals
+        B scaled by the square roots of the (non-negative) weights; this is
+        a single symmetric BLAS product in O(N d^2) time without the
+        (N+1) x d x d array of outer products
+        """
+
+        Residuals = self.residuals(Mean)
+        np.sqrt(Pstates, out=self.SqrtPstates)
+        np.multiply(Residuals, self.SqrtPstates[:,None], out=self.Products)
+
+        return np.dot(self.Products.T, self.Products, out=self.WeightedCov)
+
+
+    def normaliseAndResample(self, LogPosteriors, LogKs, U):
+
+        """
+        Normalises the IS-weights with logarithms LogPosteriors + LogKs by a
+        log-sum-exp shifted by their maximum, and samples states by inverse
+        CDF lookup of the uniforms U in the cumulative unnormalised weights,
+        which cannot return an index beyond the last state. Apart from the
+        lookup, all steps are O(N) and write into the workspace
+
+        Inputs:
+        -------
+        LogPosteriors   - array_like
+                        (N+1)-dimensional array of log-posteriors
+        LogKs           - array_like
+                        (N+1)-dimensional array of log transition
+                        probabilities
+        U               - array_like
+                        uniforms in [0,1) of the sampled states
+
+        Outputs:
+        -------
+        LogPstates      - array_like
+                        (N+1)-dimensional array of normalised log IS-weights
+        Pstates         - array_like
+                        (N+1)-dimensional array of normalised IS-weights
+        Is              - array_like
+                        indices of sampled states
+        ESS             - float
+                        effective sample size 1/sum(Pstates^2) of IS-weights
+        """
+
+        LogPstates = np.add(LogPosteriors, LogKs, out=self.LogPstates)
+        LogPstates -= np.max(LogPstates)
+        Pstates = np.exp(LogPstates, out=self.Pstates)
+        PstatesSum = np.cumsum(Pstates, out=self.PstatesSum)
+        Total = PstatesSum[-1]
+        Is = np.searchsorted(PstatesSum, np.multiply(U, Total, \
+                                            out=self.array('ScaledU', len(U))))
+        LogPstates -= np.log(Total)
+        Pstates /= Total
+
+        return LogPstates, Pstates, Is, 1./np.dot(Pstates, Pstates)
+
+
+    def selectState(self, Is, u):
+
+        """
+        Index of the state drawn by inverse CDF lookup of the uniform u in
+        the empirical distribution of the sampled indices Is, i.e. their
+        order statistic at fraction u, found in O(N) by partial sorting
+        """
+
+        k = max(int(np.ceil(u*len(Is)))-1, 0)
+
+        return np.partition(Is, k)[k]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the streaming IS-weighted marginal histograms
+"""
+
+import unittest
+import numpy as np
+from scipy.stats import norm, t
+from Marginals import WeightedHistogram
+
+
+class WeightedHistogramTest(unittest.TestCase):
+
+    def test_resolution_after_shifted_start(self):
+
+        """
+        Heavy-tailed proposals centred away from a standard Gaussian
+        posterior, as after a poor InitMean, reach far beyond it with
+        negligible IS-weights; they must not widen the bins, so that the
+        posterior bulk is still resolved by many bins
+        """
+
+        Rng = np.random.RandomState(0)
+        Histogram = WeightedHistogram(1, 100)
+        AllProposals = list()
+        AllPstates = list()
+        for n in range(400):
+            Proposals = 3. + 3.*Rng.standard_t(3, (9,1))
+            LogWeights = norm.logpdf(Proposals[:,0]) - t.logpdf(Proposals[:,0], 3, 3., 3.)
+            Pstates = np.exp(LogWeights - np.max(LogWeights))
+            Pstates /= np.sum(Pstates)
+            Histogram.add(Proposals, Pstates)
+            AllProposals.append(Proposals[:,0])
+            AllPstates.append(Pstates)
+
+        Edges, Density = Histogram.getDensity()
+        Inside = np.sum((Edges[0,:-1] >= -3.) & (Edges[0,1:] <= 3.))
+        self.assertGreaterEqual(Inside, 12)
+
+        # Binned weights agree with a direct histogram (up to proposals at bin
+        # edges), and outlying weight is small
+        AllProposals = np.concatenate(AllProposals)
+        AllPstates = np.concatenate(AllPstates)
+        Direct = np.histogram(AllProposals, Edges[0], weights=AllPstates)[0] \
+                 /(np.sum(AllPstates)*np.diff(Edges[0]))
+        np.testing.assert_allclose(Density[0], Direct, atol=1e-4)
+        self.assertLessEqual(Histogram.Outlying[0], Histogram.Tol*Histogram.Total)
+
+
+if __name__ == '__main__':
+    unittest.main()
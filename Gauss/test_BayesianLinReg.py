@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the IS-estimates of IS-MP-QMCMC for a standard Gaussian posterior
+"""
+
+import unittest
+import numpy as np
+from BayesianLinReg import BayesianLinReg
+
+
+class CovEstimateTest(unittest.TestCase):
+
+    def test_shifted_proposal_mean(self):
+
+        """
+        The covariance estimate is centred on the IS mean rather than on the
+        proposal mean InitMean, so that a shifted InitMean does not add
+        (PostMean-InitMean)(PostMean-InitMean)^T to it
+        """
+
+        d = 2
+        InitMean = 2.*np.ones(d)
+        InitCov = 4.*np.identity(d)
+        for History in [True, False]:
+            np.random.seed(0)
+            BLR = BayesianLinReg(d, np.zeros(d), 8, 1.5, 14, InitMean, InitCov, \
+                                 'iid', History=History)
+            np.testing.assert_allclose(BLR.GetIS_CovEstimate(8), np.identity(d), \
+                                       atol=0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()